@@ -1,6 +1,5 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_session import Session
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
 from app.models import db
@@ -10,6 +9,14 @@ import os
 import pandas as pd
 from app.recognition_routes import bp as recognition_bp
 from app.migrate_routes import process_data
+from utils.db_monitor import init_db_monitor
+from utils.cart_store import create_cart_store
+from utils.templates import load_email_templates
+from utils.rate_limit import create_rate_limiter, init_rate_limits
+from utils.tasks import create_task_executor, init_task_executor
+from utils.token_revocation import create_revocation_store
+from utils.sessions import init_sessions
+from utils.copurchase import init_copurchase_index
 
 pymysql.install_as_MySQLdb()
 
@@ -30,12 +37,22 @@ def create_app():
         'http://localhost:8081'
     ])
 
-    app.config['SESSION_SQLALCHEMY'] = db
-    Session(app)
+    init_sessions(app)
 
     Migrate(app, db)
 
+    app.extensions['cart_store'] = create_cart_store(app.config)
+    app.extensions['rate_limiter'] = create_rate_limiter(app.config)
+    app.extensions['task_executor'] = create_task_executor(app)
+    app.extensions['token_revocations'] = create_revocation_store(app.config)
+    load_email_templates()
+
+    init_rate_limits(app)
+    init_task_executor(app)
+    init_copurchase_index(app)
+
     with app.app_context():
+        init_db_monitor(app, db.engine)
         db.create_all()
         # import csv file
         csv_file_path = 'data/mediscan.csv'
@@ -99,6 +116,15 @@ def create_app():
     from app.migrate_routes import bp as migrate_bp
     app.register_blueprint(migrate_bp)
 
+    from app.monitor_routes import bp as monitor_bp
+    app.register_blueprint(monitor_bp)
+
+    from app.report_routes import bp as report_bp
+    app.register_blueprint(report_bp)
+
+    from app.recommendation_routes import bp as recommendation_bp
+    app.register_blueprint(recommendation_bp)
+
     app.register_blueprint(recognition_bp) 
 
     return app
@@ -1,18 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app, make_response
 from app.app import db
 from app.models import Customers, Employees, Order
-from utils.otp import request_temp_password
-from utils.jwt import generate_jwt, blacklist_jwt
+from utils.otp import request_temp_password, create_temp_password, hash_otp, verify_temp_password
+from utils.jwt import generate_jwt, is_revoked, revoke_jwt
 from utils.validation import is_valid_email, is_valid_phone, get_customer_by_contact, get_employee_by_id
 from utils.status import handle_error, handle_success
+from utils.auth import require_auth, get_claims, get_principal
 from datetime import datetime, timedelta
 from flask_bcrypt import Bcrypt
-import jwt
-import random
 
 bp = Blueprint('auth', __name__)
 bcrypt = Bcrypt()
-blacklist = set()
 
 def get_pepper():
     return current_app.config['SECRET_KEY']
@@ -53,17 +51,13 @@ def verify_otp():
     if not customer:
         return handle_error('Customer not found', 404)
     
-    pepper = get_pepper()
-    otp_with_pepper = otp + pepper
-    
-    if not bcrypt.check_password_hash(customer.temporary_password, otp_with_pepper):
-        return handle_error('Invalid OTP', 400)
-
-    if datetime.now() > customer.password_expiry:
-        return handle_error('OTP expired', 400)
+    error = verify_temp_password(customer, otp)
+    if error:
+        return handle_error(*error)
 
     customer.temporary_password = None
     customer.password_expiry = None
+    customer.otp_attempts = 0
     db.session.commit()
 
     token = generate_jwt({'customer_id': customer.id})
@@ -77,7 +71,7 @@ def register_customer():
         phone = data.get('phone')
         full_name = data.get('fullName')
         address = data.get('address')
-        otp = str(random.randint(100000, 999999))
+        otp = create_temp_password()
         password_expiry = datetime.now() + timedelta(minutes=5)
         
         if not email and not phone:
@@ -93,18 +87,15 @@ def register_customer():
                 'token': token
             }), 201
 
-        pepper = get_pepper()
-        otp_with_pepper = otp + pepper
-        hashed_otp = bcrypt.generate_password_hash(otp_with_pepper).decode('utf-8')
-
         # Create new customer
         new_customer = Customers(
             email=email,
             phone=phone,
             full_name=full_name,
             address=address,
-            temporary_password=hashed_otp,
+            temporary_password=hash_otp(otp),
             password_expiry=password_expiry,
+            otp_attempts=0,
             created_at=datetime.now(),
             updated_at=datetime.now()
         )
@@ -149,24 +140,10 @@ def update_customer():
         return handle_error(f"An error occurred: {str(e)}", 500)
 
 @bp.route('/api/customers/me', methods=['GET'])
-def get_customer():   
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return handle_error('No authorization token provided', 401)
-
-    token = auth_header.split(" ")[1]  # Extract token from "Bearer <token>"
-    
+@require_auth('customer')
+def get_customer():
     try:
-        if blacklist_jwt(token):
-            return handle_error('Token has been revoked', 401)
-        
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        customer_id = data.get('customer_id')
-        
-        if not customer_id:
-            return handle_error('Invalid token', 401)
-
-        customer = Customers.query.get(customer_id)
+        customer = get_principal('customer')
         if not customer:
             return handle_error('Customer not found', 404)
 
@@ -180,12 +157,7 @@ def get_customer():
             'gender': customer.gender,
             'address': customer.address,
         }), 200
-        
 
-    except jwt.ExpiredSignatureError:
-        return handle_error('Token has expired', 401)
-    except jwt.InvalidTokenError:
-        return handle_error('Invalid token', 401)
     except Exception as e:
         return handle_error(f"An error occurred: {str(e)}", 500)
 
@@ -198,10 +170,10 @@ def logout_customer():
 
     token = auth_header.split(" ")[1]
 
-    if blacklist_jwt(token):
+    if is_revoked(token):
         return handle_error('Token has already been revoked', 401)
 
-    blacklist.add(token)
+    revoke_jwt(token)
     response = make_response(handle_success('Logout successful'))
     response.delete_cookie('token', path='/', domain=None)
     
@@ -291,22 +263,10 @@ def login_employee():
         return handle_error('Invalid credentials', 400)
 
 @bp.route('/api/employees/me', methods=['GET'])
+@require_auth('employee')
 def get_employee():
-    token = request.cookies.get('token')
-    if not token:
-        return handle_error('No authorization token provided', 401)
-    
     try:
-        if blacklist_jwt(token):
-            return handle_error('Token has been revoked', 401)
-        
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        employee_id = data.get('employee_id')
-        
-        if not employee_id:
-            return handle_error('Invalid token', 401)
-
-        employee = Employees.query.filter_by(employee_id=employee_id).first()
+        employee = get_principal('employee')
         if not employee:
             return handle_error('Employee not found', 404)
 
@@ -318,10 +278,6 @@ def get_employee():
             'imgUrl': employee.img_url,
         }), 200
 
-    except jwt.ExpiredSignatureError:
-        return handle_error('Token has expired', 401)
-    except jwt.InvalidTokenError:
-        return handle_error('Invalid token', 401)
     except Exception as e:
         return handle_error(f"An error occurred: {str(e)}", 500)
 
@@ -329,29 +285,17 @@ def get_employee():
 def logout_employee():
     token = request.cookies.get('token')
     if token:
-        blacklist.add(token)
+        revoke_jwt(token)
 
     response = make_response(handle_success('Logout successful'))
     response.delete_cookie('token', path='/', domain=None)  # delete the JWT token cookie
     return response
 
 @bp.route('/api/employees/update', methods=['PUT'])
+@require_auth('employee')
 def update_employee():
-    token = request.cookies.get('token')
-    if not token:
-        return handle_error('No authorization token provided', 401)
-
     try:
-        if blacklist_jwt(token):
-            return handle_error('Token has been revoked', 401)
-
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        employee_id = data.get('employee_id')
-
-        if not employee_id:
-            return handle_error('Invalid token', 401)
-
-        employee = Employees.query.filter_by(employee_id=employee_id).first()
+        employee = get_principal('employee')
         if not employee:
             return handle_error('Employee not found', 404)
 
@@ -383,25 +327,14 @@ def update_employee():
         db.session.commit()
         return handle_success('Employee profile updated successfully')
 
-    except jwt.ExpiredSignatureError:
-        return handle_error('Token has expired', 401)
-    except jwt.InvalidTokenError:
-        return handle_error('Invalid token', 401)
     except Exception as e:
         return handle_error(f"An error occurred: {str(e)}", 500)
 
 @bp.route('/api/employees/delete/<int:id>', methods=['DELETE'])
+@require_auth('employee')
 def delete_employee(id):
-    token = request.cookies.get('token')
-    if not token:
-        return handle_error('No authorization token provided', 401)
-
     try:
-        if blacklist_jwt(token):
-            return handle_error('Token has been revoked', 401)
-
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        employee_id = data.get('employee_id')
+        employee_id = get_claims('employee')['employee_id']
 
         if str(employee_id) != str(id):
             return handle_error('Unauthorized action', 403)
@@ -412,7 +345,7 @@ def delete_employee(id):
         if not password:
             return handle_error('Password is required', 400)
 
-        employee = Employees.query.filter_by(employee_id=id).first()
+        employee = get_principal('employee')
         if not employee:
             return handle_error('Employee not found', 404)
 
@@ -423,15 +356,11 @@ def delete_employee(id):
         db.session.delete(employee)
         db.session.commit()
 
-        blacklist.add(token)
+        revoke_jwt(request.cookies.get('token'))
 
         response = make_response(handle_success('Employee account deleted successfully'))
         response.delete_cookie('token', path='/', domain=None)  # delete the JWT token cookie
         return response
 
-    except jwt.ExpiredSignatureError:
-        return handle_error('Token has expired', 401)
-    except jwt.InvalidTokenError:
-        return handle_error('Invalid token', 401)
     except Exception as e:
         return handle_error(f"An error occurred: {str(e)}", 500)
\ No newline at end of file
@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app
+from sqlalchemy.orm import selectinload
 from app.app import db
-from app.models import Cart, CartItem, Products
+from app.models import Products
+from utils.cart_store import get_cart_store
 from utils.status import handle_error, handle_success
-from datetime import datetime
 import uuid
 
 bp = Blueprint('cart', __name__)
@@ -30,34 +31,7 @@ def add_to_cart():
         if not product.price:
             return handle_error('Product price is invalid', 400)
         
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
-        if not cart:
-            cart = Cart(cart_id=cart_id)
-            db.session.add(cart)
-            db.session.commit()
-            
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product.id).first()
-        if cart_item:
-            cart_item.quantity += quantity
-            cart_item.price_at_purchase = product.price
-            cart_item.updated_at = datetime.now()
-        else:
-            new_cart_item = CartItem(
-                cart_id=cart.id,
-                product_id=product.id,
-                product_name=product.product_name,
-                quantity=quantity,
-                price_at_purchase=product.price,
-                brand_name=product.brand_name,
-                generic_name=product.generic_name,
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-
-            new_cart_item.images = product.images
-            db.session.add(new_cart_item)
-        
-        db.session.commit()
+        get_cart_store().add_item(cart_id, product, quantity)
         return cart_id
     except Exception as e:
         return handle_error(f"An error occurred: {str(e)}", 500)
@@ -71,18 +45,16 @@ def view_cart():
         if not cart_id:
             return handle_error('Cart ID is required', 400)
 
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
-        if not cart:
+        cart_items = get_cart_store().get_items(cart_id)
+        if cart_items is None:
             return handle_error('Cart not found', 404)
-
-        cart_items = CartItem.query.filter_by(cart_id=cart.id).all()
         
         if not cart_items:
             return handle_error('No items found in cart', 404)
         
         cart_data = {
             'cart_id': cart_id,
-            'items': [item.to_json() for item in cart_items]
+            'items': cart_items
         }
         
         return jsonify(cart_data), 200
@@ -91,6 +63,62 @@ def view_cart():
 
 
 
+# Apply several add/update/remove operations in one transaction
+@bp.route('/api/carts/batch', methods=['POST'])
+def batch_update_cart():
+    try:
+        data = request.get_json()
+        cart_id = data.get('cart_id')
+        operations = data.get('operations') or []
+
+        if not operations:
+            return handle_error('Operations are required', 400)
+        if len(operations) > current_app.config['CART_BATCH_MAX_OPERATIONS']:
+            return handle_error('Too many operations in one batch', 400)
+
+        for operation in operations:
+            op = operation.get('op')
+            quantity = operation.get('quantity')
+            if op not in ('add', 'update', 'remove'):
+                return handle_error(f"Unknown operation: {op}", 400)
+            if not operation.get('product_id'):
+                return handle_error('Product ID is required', 400)
+            if op != 'remove' and (not isinstance(quantity, int) or quantity <= 0):
+                return handle_error('Quantity must be a positive integer', 400)
+
+        # Resolve every product in the batch with one query
+        codes = {operation['product_id'] for operation in operations}
+        products = {
+            product.product_id: product
+            for product in Products.query.options(selectinload(Products.images)).filter(Products.product_id.in_(codes))
+        }
+        for operation in operations:
+            if operation['op'] == 'add':
+                product = products.get(operation['product_id'])
+                if not product:
+                    return handle_error(f"Product not found: {operation['product_id']}", 404)
+                if not product.price:
+                    return handle_error('Product price is invalid', 400)
+
+        if (cart_id is None) or (cart_id == ''):
+            cart_id = str(uuid.uuid4())
+            session['cart_id'] = cart_id
+
+        store = get_cart_store()
+        try:
+            store.apply_batch(cart_id, operations, products)
+        except ValueError as e:
+            db.session.rollback()
+            return handle_error(str(e), 404)
+
+        return jsonify({
+            'cart_id': cart_id,
+            'items': store.get_items(cart_id) or []
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
 # Update cart item quantity
 @bp.route('/api/carts/update', methods=['PUT'])
 def update_cart_item():
@@ -109,24 +137,13 @@ def update_cart_item():
         if quantity <= 0:
             return handle_error('Quantity must be a positive integer', 400)
 
-        cart = Cart.query.filter_by(cart_id=cart_id_str).first()
-        
-        if not cart:
+        store = get_cart_store()
+        if not store.cart_exists(cart_id_str):
             return handle_error('Cart not found', 404)
 
-        # Now use the cart.id (primary key) to find the CartItem
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-        
-        if not cart_item:
+        if not store.set_quantity(cart_id_str, product_id, quantity):
             return handle_error('Cart item not found', 404)
 
-        if quantity <= 0:
-            db.session.delete(cart_item)
-        else:
-            cart_item.quantity = quantity
-            cart_item.updated_at = datetime.now()
-
-        db.session.commit()
         return handle_success('Cart item updated successfully')
     except Exception as e:
         return handle_error(f'An error occurred: {str(e)}', 500)
@@ -146,18 +163,13 @@ def remove_from_cart():
         if not cart_id:
             return handle_error('Cart not found', 404)
 
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
-        if not cart:
+        store = get_cart_store()
+        if not store.cart_exists(cart_id):
             return handle_error('Cart not found', 404)
 
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-
-        if not cart_item:
+        if not store.remove_item(cart_id, product_id):
             return handle_error('Cart item not found', 404)
 
-        db.session.delete(cart_item)
-        db.session.commit()
-
         return handle_success('Item removed from cart successfully')
     except Exception as e:
         print(f"Error occurred: {str(e)}")
@@ -167,15 +179,8 @@ def remove_from_cart():
 @bp.route('/api/carts/delete/<string:cart_id>', methods=['DELETE'])
 def delete_cart(cart_id):
     try:
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
-        
-        if not cart:
+        if not get_cart_store().delete_cart(cart_id):
             return handle_error('Cart not found', 404)
-        
-        CartItem.query.filter_by(cart_id=cart.id).delete()
-        
-        db.session.delete(cart)
-        db.session.commit()
 
         print(f"Cart {cart_id} deleted successfully")
         return handle_success('Cart deleted successfully')
@@ -1,21 +1,61 @@
 import os
 from dotenv import load_dotenv
+from utils.db_monitor import MonitoredQueuePool
 
 load_dotenv()
 
 class Config:
-    # Flask-Session configuration
-    SESSION_TYPE = 'sqlalchemy'
+    # Session storage: 'cookie' (signed cookie), 'memory', 'redis' or
+    # 'sqlalchemy' (see utils/sessions.py)
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'cookie')
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
+    SESSION_REFRESH_EACH_REQUEST = False
     SESSION_SQLALCHEMY_TABLE = 'sessions'
+    SESSION_MEMORY_MAX_ENTRIES = int(os.getenv('SESSION_MEMORY_MAX_ENTRIES', 10000))
     
     # Database configuration
     DEBUG = False
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = os.getenv('SQLALCHEMY_ECHO', 'False').lower() == 'true'
+
+    # Connection pool configuration
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 20))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv('SQLALCHEMY_POOL_TIMEOUT', 30))
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv('SQLALCHEMY_POOL_RECYCLE', 1800))
+    SQLALCHEMY_POOL_PRE_PING = os.getenv('SQLALCHEMY_POOL_PRE_PING', 'True').lower() == 'true'
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': MonitoredQueuePool,
+        'pool_size': SQLALCHEMY_POOL_SIZE,
+        'max_overflow': SQLALCHEMY_MAX_OVERFLOW,
+        'pool_timeout': SQLALCHEMY_POOL_TIMEOUT,
+        'pool_recycle': SQLALCHEMY_POOL_RECYCLE,
+        'pool_pre_ping': SQLALCHEMY_POOL_PRE_PING,
+    }
+
+    # Only statements slower than this are written to the slow query log
+    SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+
+    # Per-request query instrumentation
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+    QUERY_BUDGET_ENFORCE = os.getenv('QUERY_BUDGET_ENFORCE', 'False').lower() == 'true'
+    QUERY_BUDGET_DEFAULT = None
+    # Maximum statements per request, keyed by endpoint name
+    QUERY_BUDGETS = {
+        'cart.view_cart': 3,
+        'orders.create_order': 18,
+        'orders.view_orders': 2,
+        'orders.view_order': 2,
+        'orders.reorder': 10,
+        'reports.sales_report': 1,
+        'reports.product_report': 1,
+        'reports.customer_report': 1,
+        'recommendations.get_product_recommendations': 1,
+        'recommendations.get_basket_recommendations': 1,
+    }
     
     MYSQL_DATABASE = os.getenv('MYSQL_DATABASE')
     MYSQL_USER = os.getenv('MYSQL_USER')
@@ -23,6 +63,117 @@ class Config:
     MYSQL_ROOT_PASSWORD = os.getenv('MYSQL_ROOT_PASSWORD')
     DATABASE_URL = os.getenv('DATABASE_URL')
     
+    # Redis configuration ('fakeredis://' uses an in-process fake)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+    # Background tasks: 'celery' (workers and beat on CELERY_BROKER_URL) or
+    # 'thread' (an in-process pool in each web process, fed from the
+    # background_tasks table, which replaces celery beat)
+    CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
+    CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+    TASK_BACKEND = os.getenv('TASK_BACKEND', 'celery')
+    TASK_WORKERS = int(os.getenv('TASK_WORKERS', 4))
+    TASK_POLL_SECONDS = float(os.getenv('TASK_POLL_SECONDS', 1))
+    TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', 900))
+    TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 3))
+    TASK_RETRY_SECONDS = int(os.getenv('TASK_RETRY_SECONDS', 30))
+
+    # Cart storage: 'sql', 'memory' or 'redis'
+    CART_STORE = os.getenv('CART_STORE', 'sql')
+    CART_TTL_SECONDS = int(os.getenv('CART_TTL_SECONDS', 7 * 24 * 3600))
+    CART_REAPER_BATCH_SIZE = int(os.getenv('CART_REAPER_BATCH_SIZE', 500))
+    CART_BATCH_MAX_OPERATIONS = int(os.getenv('CART_BATCH_MAX_OPERATIONS', 100))
+
+    # Order totals are computed server-side from the cart lines
+    SHIPPING_FEE = float(os.getenv('SHIPPING_FEE', 5.00))
+    FREE_SHIPPING_THRESHOLD = float(os.getenv('FREE_SHIPPING_THRESHOLD', 20.00))
+
+    # Order history pagination
+    ORDER_PAGE_SIZE = int(os.getenv('ORDER_PAGE_SIZE', 20))
+    ORDER_PAGE_MAX_SIZE = int(os.getenv('ORDER_PAGE_MAX_SIZE', 100))
+
+    # Stored responses for retried requests carrying an Idempotency-Key header
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+    # How long a request may hold its key before a retry can take it over
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+    # Sales reports read the rollup tables; default window in days
+    REPORT_DEFAULT_DAYS = int(os.getenv('REPORT_DEFAULT_DAYS', 30))
+
+    # Frequently-bought-together index, rebuilt nightly and served from memory;
+    # each web worker folds in new orders in the background
+    COPURCHASE_INDEX_PATH = os.getenv('COPURCHASE_INDEX_PATH', 'data/copurchase_index.npz')
+    COPURCHASE_TOP_K = int(os.getenv('COPURCHASE_TOP_K', 20))
+    COPURCHASE_MAX_ORDER_LINES = int(os.getenv('COPURCHASE_MAX_ORDER_LINES', 50))
+    COPURCHASE_REFRESH_SECONDS = int(os.getenv('COPURCHASE_REFRESH_SECONDS', 60))
+    COPURCHASE_BUILD_LOCK_SECONDS = int(os.getenv('COPURCHASE_BUILD_LOCK_SECONDS', 3600))
+
+    # Reorder reminders go out once per order, this long after it was placed
+    REMINDER_DELAY_DAYS = float(os.getenv('REMINDER_DELAY_DAYS', 30))
+    REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 200))
+    # Each reminder run is split into customer id ranges of this many
+    # customers with due orders, processed as separate Celery tasks and
+    # retried independently; batches within a chunk are REMINDER_BATCH_SIZE
+    # customers
+    REMINDER_CHUNK_SIZE = int(os.getenv('REMINDER_CHUNK_SIZE', 2000))
+    REMINDER_CHUNK_MAX_RETRIES = int(os.getenv('REMINDER_CHUNK_MAX_RETRIES', 5))
+    REMINDER_CHUNK_RETRY_SECONDS = int(os.getenv('REMINDER_CHUNK_RETRY_SECONDS', 30))
+
+    # Token bucket storage: 'memory' (per process) or 'redis' (shared)
+    RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'memory')
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    # Request limits keyed by endpoint name, as (scope, 'amount/period') rules.
+    # scope is 'ip', 'principal' (the signed-in customer or employee, else the
+    # IP) or 'route' (all clients together); period is second, minute, hour
+    # or day. Every rule of an endpoint must have a token for a request to pass.
+    RATE_LIMITS = {
+        'recognition.predict': [('principal', '10/minute'), ('route', '120/minute')],
+        'recognition.predict_mobile': [('principal', '10/minute'), ('route', '120/minute')],
+        'recognition.upload_image': [('principal', '10/minute'), ('route', '60/minute')],
+        'auth.request_otp': [('ip', '5/minute'), ('ip', '30/hour')],
+        'auth.verify_otp': [('ip', '20/minute')],
+        'product.get_products': [('ip', '30/minute')],
+        'product.get_detail': [('ip', '30/minute')],
+        'product.get_product_by_name': [('ip', '30/minute'), ('route', '300/minute')],
+    }
+
+    # Outgoing email is queued in email_outbox and sent by a background worker.
+    # EMAIL_TRANSPORT: 'sendgrid', 'memory' (kept in process) or 'file'
+    # (written to EMAIL_FILE_DIR) for local development and tests
+    EMAIL_TRANSPORT = os.getenv('EMAIL_TRANSPORT', 'sendgrid')
+    EMAIL_FILE_DIR = os.getenv('EMAIL_FILE_DIR', 'email_outbox')
+    EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 100))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 8))
+    EMAIL_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+    EMAIL_RETRY_MAX_SECONDS = int(os.getenv('EMAIL_RETRY_MAX_SECONDS', 3600))
+    EMAIL_SEND_LEASE_SECONDS = int(os.getenv('EMAIL_SEND_LEASE_SECONDS', 300))
+    SENDGRID_TIMEOUT = float(os.getenv('SENDGRID_TIMEOUT', 10))
+    # Recipients per bulk API call (SendGrid allows up to 1000 personalizations)
+    EMAIL_BULK_BATCH_SIZE = int(os.getenv('EMAIL_BULK_BATCH_SIZE', 500))
+    # SendGrid rejects personalizations with more substitution data than this;
+    # such recipients are rendered locally and sent on their own
+    EMAIL_MAX_SUBSTITUTION_BYTES = int(os.getenv('EMAIL_MAX_SUBSTITUTION_BYTES', 10000))
+    # Provider API calls per second across all senders (0 disables the limit);
+    # only global when RATE_LIMIT_STORE is 'redis'
+    EMAIL_SEND_RATE = float(os.getenv('EMAIL_SEND_RATE', 10))
+    EMAIL_SEND_BURST = int(os.getenv('EMAIL_SEND_BURST', 20))
+
+    # Customer and employee tokens expire after this long
+    JWT_TTL_SECONDS = int(os.getenv('JWT_TTL_SECONDS', 7 * 24 * 3600))
+    # Verified token claims cached per process, by token digest
+    AUTH_CLAIMS_CACHE_SIZE = int(os.getenv('AUTH_CLAIMS_CACHE_SIZE', 10000))
+    # Revoked tokens: 'memory' (per process) or 'redis' (shared, behind a local
+    # Bloom filter refreshed every TOKEN_REVOCATION_SYNC_SECONDS). Defaults to
+    # 'redis' when REDIS_URL is set, since a per-process store only honours a
+    # logout in the worker that handled it.
+    TOKEN_REVOCATION_STORE = os.getenv('TOKEN_REVOCATION_STORE', 'redis' if os.getenv('REDIS_URL') else 'memory')
+    TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv('TOKEN_REVOCATION_SYNC_SECONDS', 5))
+    TOKEN_REVOCATION_BLOOM_CAPACITY = int(os.getenv('TOKEN_REVOCATION_BLOOM_CAPACITY', 100000))
+    TOKEN_REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('TOKEN_REVOCATION_BLOOM_ERROR_RATE', 0.001))
+
+    # Verification attempts allowed per OTP before a new one must be requested
+    OTP_MAX_ATTEMPTS = int(os.getenv('OTP_MAX_ATTEMPTS', 5))
+
     # Twilio configuration
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_SERVICE_SID = os.getenv('TWILIO_SERVICE_SID')
@@ -3,19 +3,20 @@ from app.app import db
 from app.models import Order, OrderItem, Cart, CartItem, Customers
 from utils.validation import is_valid_email
 from utils.status import handle_error, handle_success
-from utils.email import send_payment_success_email
+from utils.email import queue_payment_success_email
 from flask import Blueprint, request, jsonify
 from app.app import db
 from app.models import Order, OrderItem
-from utils.email import send_payment_success_email
+from utils.email import queue_payment_success_email
+from utils.idempotency import idempotent
+from utils.outbox import send_queued_emails
 from datetime import datetime, timedelta
 
-from utils.reminder import send_me_reminder_email
-
 
 bp = Blueprint('email', __name__)
 
 @bp.route('/api/payment-success', methods=['POST'])
+@idempotent('email.payment_success')
 def send_payment_email():
     try:
         data = request.json
@@ -29,7 +30,7 @@ def send_payment_email():
         total_price = data['totalPrice']
         image_urls = data['imageUrls']
         
-        send_payment_success_email(    
+        queue_payment_success_email(
             username,
             email, 
             address,
@@ -37,12 +38,14 @@ def send_payment_email():
             items, 
             subtotal_price,
             shipping_fee,
-            total_price,
-            image_urls
+            total_price
         )
+        db.session.commit()
+        send_queued_emails()
 
         return handle_success('Email sent successfully')
     except Exception as e:
+        db.session.rollback()
         print(f"Error: {str(e)}")
         return handle_error('Failed to send email', 500)
 
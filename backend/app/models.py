@@ -17,6 +17,7 @@ class Customers(db.Model):
     address = db.Column(db.String(120), nullable=True)
     temporary_password = db.Column(db.String(255), nullable=True)
     password_expiry = db.Column(db.DateTime, nullable=True)
+    otp_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     last_otp_request = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
@@ -213,10 +214,10 @@ class Cart(db.Model):
     cart_id = db.Column(db.String(36), unique=True, nullable=False, index=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, index=True)
 
     customer = db.relationship('Customers', backref='cart', lazy=True)
-    items = db.relationship('CartItem', backref='cart', lazy=True, cascade="all, delete-orphan")
+    items = db.relationship('CartItem', backref='cart', lazy=True, cascade="all, delete-orphan", order_by='CartItem.id')
 
     def to_json(self):
         return {
@@ -228,13 +229,11 @@ class Cart(db.Model):
             'items': [item.to_json() for item in self.items]
         }
 
-cart_item_images = db.Table('cart_item_images',
-    db.Column('cart_item_id', db.Integer, db.ForeignKey('cart_items.id'), primary_key=True),
-    db.Column('image_id', db.Integer, db.ForeignKey('product_images.id'), primary_key=True)
-)
-
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'product_id', name='uq_cart_items_cart_product'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'), nullable=False)
     product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
@@ -247,8 +246,6 @@ class CartItem(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
 
     product = db.relationship('Products', backref='cart_items', lazy=True)
-    images = db.relationship('ProductImage', secondary=cart_item_images, lazy='subquery',
-                             backref=db.backref('cart_items', lazy=True))
 
     def to_json(self):
         return {
@@ -262,7 +259,7 @@ class CartItem(db.Model):
             'genericName': self.generic_name,
             'createdAt': self.created_at,
             'updatedAt': self.updated_at,
-            'images': [image.to_json() for image in self.images]
+            'images': [image.to_json() for image in self.product.images]
         }
 
 class Order(db.Model):
@@ -271,13 +268,14 @@ class Order(db.Model):
     order_number = db.Column(db.String(36), unique=True, nullable=False, index=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
+    reminder_sent_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
 
     customer = db.relationship('Customers', backref='orders', lazy=True)
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade="all, delete-orphan")
 
-    def to_json(self):
+    def to_json(self, items=None):
         return {
             'id': self.id,
             'orderNumber': self.order_number,
@@ -285,7 +283,7 @@ class Order(db.Model):
             'totalPrice': self.total_price,
             'createdAt': self.created_at,
             'updatedAt': self.updated_at,
-            'items': [item.to_json() for item in self.items]
+            'items': items if items is not None else [item.to_json() for item in self.items]
         }
 
 class OrderItem(db.Model):
@@ -301,14 +299,142 @@ class OrderItem(db.Model):
 
     product = db.relationship('Products', backref='order_items', lazy=True)
 
-    def to_json(self):
+    def to_json(self, product_code=None):
         return {
             'id': self.id,
             'orderId': self.order_id,
-            'productId': self.product.product_id,
+            'productId': product_code or self.product.product_id,
             'productName': self.product_name,
             'quantity': self.quantity,
             'priceAtPurchase': self.price_at_purchase,
             'createdAt': self.created_at,
             'updatedAt': self.updated_at
-        }
\ No newline at end of file
+        }
+# Sales rollups, maintained incrementally when an order is created
+class DailySales(db.Model):
+    __tablename__ = 'daily_sales'
+    day = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    def to_json(self):
+        return {
+            'day': self.day.isoformat(),
+            'orderCount': self.order_count,
+            'units': self.units,
+            'revenue': round(self.revenue, 2)
+        }
+
+class ProductDailySales(db.Model):
+    __tablename__ = 'product_daily_sales'
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+class CustomerOrderStats(db.Model):
+    __tablename__ = 'customer_order_stats'
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    first_order_at = db.Column(db.DateTime, nullable=False)
+    last_order_at = db.Column(db.DateTime, nullable=False)
+
+    def to_json(self):
+        return {
+            'customerId': self.customer_id,
+            'orderCount': self.order_count,
+            'units': self.units,
+            'totalSpent': round(self.total_spent, 2),
+            'firstOrderAt': self.first_order_at,
+            'lastOrderAt': self.last_order_at
+        }
+
+# Progress of incremental background jobs, e.g. the last order id processed
+class JobWatermark(db.Model):
+    __tablename__ = 'job_watermarks'
+    name = db.Column(db.String(80), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+# Emails waiting to be sent by the outbox worker. Rows are added in the same
+# transaction as the change that triggers the email.
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    category = db.Column(db.String(40), nullable=False)
+    to_email = db.Column(db.String(345), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    # Either the full message, or a shared bulk body plus this recipient's
+    # substitutions (JSON object of tag -> value)
+    html_content = db.Column(db.Text(length=16777215), nullable=True)
+    bulk_body_id = db.Column(db.Integer, db.ForeignKey('email_bulk_bodies.id'), nullable=True)
+    substitutions = db.Column(db.Text(length=16777215), nullable=True)
+    # pending -> sent, or failed once EMAIL_MAX_ATTEMPTS is reached
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    bulk_body = db.relationship('EmailBulkBody', lazy=True)
+
+# Message body shared by many outbox rows, e.g. one reminder digest run
+class EmailBulkBody(db.Model):
+    __tablename__ = 'email_bulk_bodies'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    html_content = db.Column(db.Text(length=16777215), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+# Queue for the in-process task executor (TASK_BACKEND = 'thread')
+class BackgroundTask(db.Model):
+    __tablename__ = 'background_tasks'
+    __table_args__ = (
+        db.Index('ix_background_tasks_status_run_at', 'status', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(255), nullable=False)
+    # JSON object with the call's args and kwargs
+    arguments = db.Column(db.Text, nullable=False)
+    # pending -> done, or failed once TASK_MAX_ATTEMPTS is reached
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# When each periodic task was last queued by the in-process executor, shared
+# by all web processes so that only one of them queues each run
+class TaskSchedule(db.Model):
+    __tablename__ = 'task_schedules'
+    name = db.Column(db.String(255), primary_key=True)
+    # UTC
+    last_run_at = db.Column(db.DateTime, nullable=False)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    scope = db.Column(db.String(80), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    # NULL until the first request finishes; the key is then in flight
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    content_type = db.Column(db.String(80), nullable=True)
+    # Lease of the in-flight request; a retry may take the key over once it
+    # has passed, in case that request died without finishing
+    locked_until = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,16 @@
+from flask import Blueprint, jsonify
+from app.app import db
+from utils.db_monitor import get_pool_status
+from utils.status import handle_error
+from utils.auth import require_auth
+
+bp = Blueprint('monitor', __name__)
+
+# Connection pool usage and checkout wait statistics, for employees only
+@bp.route('/api/monitor/db', methods=['GET'])
+@require_auth('employee')
+def get_db_stats():
+    try:
+        return jsonify(get_pool_status(db.engine)), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
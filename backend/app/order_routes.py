@@ -1,35 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, session
 from app.app import db
-from app.models import Order, OrderItem, Cart, CartItem
 from utils.validation import get_current_customer
-from utils.status import handle_error, handle_success
-from utils.order import create_order_from_cart
-from datetime import datetime
+from utils.auth import require_auth, get_principal
+from utils.status import handle_error
+from utils.order import create_order_from_cart, get_order_summaries, get_order_detail, build_reorder
+from utils.cart_store import get_cart_store
+from utils.idempotency import idempotent
+import uuid
 
 bp = Blueprint('orders', __name__)
 
 @bp.route('/api/orders/create', methods=['POST'])
+@idempotent('orders.create')
 def create_order():
     try:
         data = request.json
         customer_id = data['customerId']
         cart_id = data['cartId']
         order_number = data['orderNumber']
-        total_price = data['totalPrice']
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
+        store = get_cart_store()
+        cart = store.persist(cart_id)
 
         if not cart:
             return handle_error('Cart not found', 404)
 
-        # create the order history
-        order_data = create_order_from_cart(customer_id, cart, order_number, total_price)
+        # create the order history; the total is computed from the cart lines
+        order_data = create_order_from_cart(customer_id, cart, order_number)
+        store.discard(cart_id)
 
         return jsonify(order_data), 201
     except Exception as e:
         print(f"Error: {str(e)}")
         return handle_error('Failed to create order', 500)
 
-# Route to view orders for a customer
+# Route to view a page of order summaries for a customer
 @bp.route('/api/orders', methods=['GET'])
 def view_orders():
     try:
@@ -38,15 +42,73 @@ def view_orders():
         if not customer_id:
             return handle_error('Customer ID is required', 400)
 
-        orders = Order.query.filter_by(customer_id=customer_id).all()
-        
-        if not orders:
+        cursor = request.args.get('cursor', type=int)
+        limit = request.args.get('limit', current_app.config['ORDER_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, current_app.config['ORDER_PAGE_MAX_SIZE']))
+
+        orders, next_cursor = get_order_summaries(customer_id, cursor, limit)
+
+        if not orders and cursor is None:
             return handle_error('No orders found for this customer', 404)
-        
+
         orders_data = {
-            'orders': [order.to_json() for order in orders]
+            'orders': orders,
+            'nextCursor': next_cursor
         }
-        
+
         return jsonify(orders_data), 200
     except Exception as e:
-        return handle_error(f"An error occurred: {str(e)}", 500)
\ No newline at end of file
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
+# Route to view a single order with its items
+@bp.route('/api/orders/<order_number>', methods=['GET'])
+@require_auth('customer')
+def view_order(order_number):
+    try:
+        customer = get_principal('customer')
+
+        if not customer:
+            return handle_error('Customer not found', 404)
+
+        order = get_order_detail(customer.id, order_number)
+
+        if not order:
+            return handle_error('Order not found', 404)
+
+        return jsonify({'order': order}), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
+# Route to add the items of a past order to a cart in one request
+@bp.route('/api/orders/<order_number>/reorder', methods=['POST'])
+@require_auth('customer')
+def reorder(order_number):
+    try:
+        customer = get_principal('customer')
+
+        if not customer:
+            return handle_error('Customer not found', 404)
+
+        reorder_data = build_reorder(customer.id, order_number)
+
+        if reorder_data is None:
+            return handle_error('Order not found', 404)
+
+        operations, products, unavailable = reorder_data
+        cart_id = (request.get_json(silent=True) or {}).get('cart_id')
+        store = get_cart_store()
+
+        if operations:
+            if (cart_id is None) or (cart_id == ''):
+                cart_id = str(uuid.uuid4())
+                session['cart_id'] = cart_id
+            store.apply_batch(cart_id, operations, products)
+
+        return jsonify({
+            'cart_id': cart_id,
+            'items': (store.get_items(cart_id) if cart_id else None) or [],
+            'unavailable': unavailable
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return handle_error(f"An error occurred: {str(e)}", 500)
@@ -0,0 +1,39 @@
+from flask import Blueprint, request, jsonify
+from utils.copurchase import get_copurchase_index
+from utils.status import handle_error
+
+bp = Blueprint('recommendations', __name__)
+
+def get_recommendation_limit():
+    return max(1, min(request.args.get('limit', 5, type=int), 20))
+
+def recommendations_json(recommendations):
+    return {
+        'recommendations': [
+            {'productId': code, 'count': count} for code, count in recommendations
+        ]
+    }
+
+# Route to view products frequently bought together with one product
+@bp.route('/api/recommendations/<string:product_id>', methods=['GET'])
+def get_product_recommendations(product_id):
+    try:
+        index = get_copurchase_index()
+        return jsonify(recommendations_json(index.recommend([product_id], get_recommendation_limit()))), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
+# Route to view products frequently bought together with a basket,
+# e.g. /api/recommendations?product_ids=P001,P002
+@bp.route('/api/recommendations', methods=['GET'])
+def get_basket_recommendations():
+    try:
+        codes = [code for code in request.args.get('product_ids', '').split(',') if code]
+
+        if not codes:
+            return handle_error('Product IDs are required', 400)
+
+        index = get_copurchase_index()
+        return jsonify(recommendations_json(index.recommend(codes, get_recommendation_limit()))), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
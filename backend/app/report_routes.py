@@ -0,0 +1,90 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import select, func
+from app.app import db
+from app.models import DailySales, ProductDailySales, CustomerOrderStats, Products, Customers
+from utils.auth import require_auth
+from utils.status import handle_error
+from datetime import date, timedelta
+
+bp = Blueprint('reports', __name__)
+
+# Reporting window from the 'from' and 'to' query parameters (YYYY-MM-DD),
+# defaulting to the last REPORT_DEFAULT_DAYS days
+def get_report_range():
+    end = request.args.get('to', type=date.fromisoformat) or date.today()
+    start = request.args.get('from', type=date.fromisoformat) or end - timedelta(days=current_app.config['REPORT_DEFAULT_DAYS'] - 1)
+    return start, end
+
+def get_report_limit():
+    return max(1, min(request.args.get('limit', 10, type=int), 100))
+
+# Route to view revenue, orders and units per day
+@bp.route('/api/reports/sales', methods=['GET'])
+@require_auth('employee')
+def sales_report():
+    try:
+        start, end = get_report_range()
+        days = DailySales.query.filter(DailySales.day.between(start, end)).order_by(DailySales.day).all()
+
+        return jsonify({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'days': [day.to_json() for day in days],
+            'totals': {
+                'orderCount': sum(day.order_count for day in days),
+                'units': sum(day.units for day in days),
+                'revenue': round(sum(day.revenue for day in days), 2)
+            }
+        }), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
+# Route to view the best-selling products in a date range
+@bp.route('/api/reports/products', methods=['GET'])
+@require_auth('employee')
+def product_report():
+    try:
+        start, end = get_report_range()
+        units = func.sum(ProductDailySales.units).label('units')
+        rows = db.session.execute(
+            select(Products.product_id, Products.product_name, units, func.sum(ProductDailySales.revenue).label('revenue'))
+            .join(Products, Products.id == ProductDailySales.product_id)
+            .where(ProductDailySales.day.between(start, end))
+            .group_by(Products.id, Products.product_id, Products.product_name)
+            .order_by(units.desc())
+            .limit(get_report_limit())
+        ).all()
+
+        return jsonify({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'products': [
+                {
+                    'productId': row.product_id,
+                    'productName': row.product_name,
+                    'units': int(row.units),
+                    'revenue': round(row.revenue, 2)
+                }
+                for row in rows
+            ]
+        }), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
+
+# Route to view the customers with the highest lifetime spend
+@bp.route('/api/reports/customers', methods=['GET'])
+@require_auth('employee')
+def customer_report():
+    try:
+        rows = db.session.execute(
+            select(CustomerOrderStats, Customers.full_name)
+            .join(Customers, Customers.id == CustomerOrderStats.customer_id)
+            .order_by(CustomerOrderStats.total_spent.desc())
+            .limit(get_report_limit())
+        ).all()
+
+        return jsonify({
+            'customers': [dict(stats.to_json(), fullName=full_name) for stats, full_name in rows]
+        }), 200
+    except Exception as e:
+        return handle_error(f"An error occurred: {str(e)}", 500)
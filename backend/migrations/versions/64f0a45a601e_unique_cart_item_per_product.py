@@ -0,0 +1,50 @@
+"""Unique cart item per cart and product
+
+Revision ID: 64f0a45a601e
+Revises: 3229e6f1893a
+Create Date: 2026-10-19 10:12:31.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '64f0a45a601e'
+down_revision = '3229e6f1893a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate lines into the oldest one before adding the constraint
+    op.execute("""
+        CREATE TEMPORARY TABLE cart_item_duplicates AS
+        SELECT cart_id, product_id, MIN(id) AS keep_id, SUM(quantity) AS total_quantity
+        FROM cart_items
+        GROUP BY cart_id, product_id
+        HAVING COUNT(*) > 1
+    """)
+    op.execute("""
+        UPDATE cart_items ci
+        JOIN cart_item_duplicates d ON ci.id = d.keep_id
+        SET ci.quantity = d.total_quantity
+    """)
+    op.execute("""
+        DELETE cii FROM cart_item_images cii
+        JOIN cart_items ci ON ci.id = cii.cart_item_id
+        JOIN cart_item_duplicates d ON ci.cart_id = d.cart_id AND ci.product_id = d.product_id AND ci.id <> d.keep_id
+    """)
+    op.execute("""
+        DELETE ci FROM cart_items ci
+        JOIN cart_item_duplicates d ON ci.cart_id = d.cart_id AND ci.product_id = d.product_id AND ci.id <> d.keep_id
+    """)
+    op.execute("DROP TEMPORARY TABLE cart_item_duplicates")
+
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_cart_items_cart_product', ['cart_id', 'product_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_cart_items_cart_product', type_='unique')
@@ -0,0 +1,134 @@
+from flask import request, g, current_app
+from app.models import db, Customers, Employees
+from utils.jwt import decode_jwt, RevokedTokenError
+from utils.token_revocation import get_revocation_store
+from utils.status import handle_error
+from collections import OrderedDict
+from functools import wraps
+import threading
+import hashlib
+import time
+import jwt
+
+# Where each kind of principal presents its token, the claim identifying it,
+# and how to load it
+def get_bearer_token():
+    parts = request.headers.get('Authorization', '').split(' ')
+    return parts[1] if len(parts) == 2 else None
+
+def get_cookie_token():
+    return request.cookies.get('token')
+
+PRINCIPALS = {
+    'customer': {
+        'token': get_bearer_token,
+        'claim': 'customer_id',
+        'load': lambda customer_id: db.session.get(Customers, customer_id),
+    },
+    'employee': {
+        'token': get_cookie_token,
+        'claim': 'employee_id',
+        'load': lambda employee_id: Employees.query.filter_by(employee_id=employee_id).first(),
+    },
+}
+
+class AuthError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+# Verified claims by token digest, least recently used first. Entries are
+# dropped once the token expires; revocation is still checked on every hit.
+class ClaimsCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            claims = self._entries.pop(key, None)
+            if claims is None or claims['exp'] <= time.time():
+                return None
+            self._entries[key] = claims
+            return claims
+
+    def set(self, key, claims):
+        with self._lock:
+            self._entries[key] = claims
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+_claims_cache = None
+_claims_cache_lock = threading.Lock()
+
+def get_claims_cache():
+    global _claims_cache
+    if _claims_cache is None:
+        with _claims_cache_lock:
+            if _claims_cache is None:
+                _claims_cache = ClaimsCache(current_app.config['AUTH_CLAIMS_CACHE_SIZE'])
+    return _claims_cache
+
+# decode_jwt with the signature check and claim parsing skipped for tokens
+# verified recently by this process
+def verify_jwt(token):
+    cache = get_claims_cache()
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    claims = cache.get(key)
+    if claims is None:
+        claims = decode_jwt(token)
+        cache.set(key, claims)
+    elif get_revocation_store().is_revoked(claims['jti']):
+        raise RevokedTokenError('Token has been revoked')
+    return claims
+
+def _verify(kind):
+    principal = PRINCIPALS[kind]
+    token = principal['token']()
+    if not token:
+        return AuthError('No authorization token provided')
+    try:
+        claims = verify_jwt(token)
+    except jwt.ExpiredSignatureError:
+        return AuthError('Token has expired')
+    except RevokedTokenError:
+        return AuthError('Token has been revoked')
+    except jwt.InvalidTokenError:
+        return AuthError('Invalid token')
+    if not claims.get(principal['claim']):
+        return AuthError('Invalid token')
+    return claims
+
+# The request's verified claims for a kind of principal, verified at most
+# once per request. Raises AuthError.
+def get_claims(kind):
+    results = g.setdefault('auth_claims', {})
+    if kind not in results:
+        results[kind] = _verify(kind)
+    if isinstance(results[kind], AuthError):
+        raise results[kind]
+    return results[kind]
+
+# The authenticated customer or employee row, loaded on first use; None if
+# the account no longer exists
+def get_principal(kind):
+    principals = g.setdefault('auth_principals', {})
+    if kind not in principals:
+        principal = PRINCIPALS[kind]
+        principals[kind] = principal['load'](get_claims(kind)[principal['claim']])
+    return principals[kind]
+
+# Rejects the request with 401 unless it carries a valid token for `kind`
+# ('customer': Authorization bearer token, 'employee': token cookie)
+def require_auth(kind):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                get_claims(kind)
+            except AuthError as e:
+                return handle_error(e.message, 401)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,51 @@
+from flask import current_app
+from sqlalchemy import select, delete
+from app.models import db, Cart, CartItem
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger('mediscan.cart_reaper')
+
+# Deletes carts idle for longer than CART_TTL_SECONDS, in batches of
+# CART_REAPER_BATCH_SIZE. Each batch is a few set-based deletes in its own
+# short transaction, so row locks are never held for long, and every delete
+# re-checks the cutoff so a cart used in the meantime survives.
+def reap_abandoned_carts(ttl_seconds=None, batch_size=None, max_batches=None):
+    ttl_seconds = ttl_seconds or current_app.config['CART_TTL_SECONDS']
+    batch_size = batch_size or current_app.config['CART_REAPER_BATCH_SIZE']
+    cutoff = datetime.now() - timedelta(seconds=ttl_seconds)
+
+    reclaimed = {'carts': 0, 'cartItems': 0, 'batches': 0}
+    while max_batches is None or reclaimed['batches'] < max_batches:
+        try:
+            # Lock the batch so a cart can't be written to while it is being
+            # deleted; carts another request holds are left for a later run
+            cart_ids = db.session.execute(
+                select(Cart.id).where(Cart.updated_at < cutoff).order_by(Cart.id).limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not cart_ids:
+                db.session.commit()
+                break
+
+            # Only delete carts that are still idle, in case one was touched
+            # after it was selected
+            idle = select(Cart.id).where(Cart.id.in_(cart_ids), Cart.updated_at < cutoff)
+            items = db.session.execute(
+                delete(CartItem).where(CartItem.cart_id.in_(idle)).execution_options(synchronize_session=False)
+            )
+            carts = db.session.execute(
+                delete(Cart).where(Cart.id.in_(cart_ids), Cart.updated_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        reclaimed['carts'] += carts.rowcount
+        reclaimed['cartItems'] += items.rowcount
+        reclaimed['batches'] += 1
+
+    logger.info('Reaped %(carts)d carts and %(cartItems)d cart items in %(batches)d batches', reclaimed)
+    return reclaimed
@@ -0,0 +1,499 @@
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload, load_only
+from app.models import db, Cart, CartItem, Products
+from utils.redis_client import get_redis
+from utils.upsert import upsert
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import json
+import time
+
+# Cart storage backends, selected with Config.CART_STORE:
+#   'sql'    - carts live in the carts/cart_items tables (default)
+#   'memory' - carts live in this process with a TTL
+#   'redis'  - carts live in Redis hashes with a TTL
+# Key-value carts are only written to Cart/CartItem rows by persist(),
+# when an order consumes them.
+
+class CartStore:
+    def cart_exists(self, cart_id):
+        raise NotImplementedError
+
+    def add_item(self, cart_id, product, quantity):
+        raise NotImplementedError
+
+    def get_items(self, cart_id):
+        raise NotImplementedError
+
+    def set_quantity(self, cart_id, product_code, quantity):
+        raise NotImplementedError
+
+    def remove_item(self, cart_id, product_code):
+        raise NotImplementedError
+
+    def delete_cart(self, cart_id):
+        raise NotImplementedError
+
+    # Applies add/update/remove operations in order, all or nothing.
+    # products maps product codes to the Products rows the batch refers to.
+    # Raises ValueError when an update or remove targets a missing line.
+    def apply_batch(self, cart_id, operations, products):
+        raise NotImplementedError
+
+    # Returns a Cart with items in the current db session, or None
+    def persist(self, cart_id):
+        raise NotImplementedError
+
+    # Called once the order created from the cart has been committed
+    def discard(self, cart_id):
+        pass
+
+class SqlCartStore(CartStore):
+    def _get_cart(self, cart_id):
+        return Cart.query.filter_by(cart_id=cart_id).first()
+
+    def _get_item(self, cart, product_code):
+        return CartItem.query.join(Products, CartItem.product_id == Products.id).filter(
+            CartItem.cart_id == cart.id, Products.product_id == product_code
+        ).first()
+
+    def cart_exists(self, cart_id):
+        return db.session.query(Cart.query.filter_by(cart_id=cart_id).exists()).scalar()
+
+    def add_item(self, cart_id, product, quantity):
+        now = datetime.now()
+        # Create (or touch) the cart and add to the line in one transaction;
+        # the upserts keep concurrent adds from duplicating lines or losing increments
+        upsert(Cart.__table__, {'cart_id': cart_id, 'created_at': now, 'updated_at': now},
+               {'updated_at': now}, ['cart_id'])
+
+        cart_pk = select(Cart.id).where(Cart.cart_id == cart_id).scalar_subquery()
+        items = CartItem.__table__
+        upsert(items, {
+            'cart_id': cart_pk,
+            'product_id': product.id,
+            'product_name': product.product_name,
+            'quantity': quantity,
+            'price_at_purchase': product.price,
+            'brand_name': product.brand_name,
+            'generic_name': product.generic_name,
+            'created_at': now,
+            'updated_at': now,
+        }, {
+            'quantity': items.c.quantity + quantity,
+            'price_at_purchase': product.price,
+            'updated_at': now,
+        }, ['cart_id', 'product_id'])
+
+        db.session.commit()
+
+    def get_items(self, cart_id):
+        # Cart, items (with product codes) and product images in three queries
+        cart = Cart.query.options(
+            selectinload(Cart.items).joinedload(CartItem.product).options(
+                load_only(Products.product_id),
+                selectinload(Products.images),
+            ),
+        ).filter_by(cart_id=cart_id).first()
+        if not cart:
+            return None
+        return [item.to_json() for item in cart.items]
+
+    def set_quantity(self, cart_id, product_code, quantity):
+        cart = self._get_cart(cart_id)
+        cart_item = self._get_item(cart, product_code) if cart else None
+        if not cart_item:
+            return False
+
+        cart_item.quantity = quantity
+        cart_item.updated_at = cart.updated_at = datetime.now()
+        db.session.commit()
+        return True
+
+    def remove_item(self, cart_id, product_code):
+        cart = self._get_cart(cart_id)
+        cart_item = self._get_item(cart, product_code) if cart else None
+        if not cart_item:
+            return False
+
+        db.session.delete(cart_item)
+        cart.updated_at = datetime.now()
+        db.session.commit()
+        return True
+
+    def delete_cart(self, cart_id):
+        cart = self._get_cart(cart_id)
+        if not cart:
+            return False
+
+        CartItem.query.filter_by(cart_id=cart.id).delete()
+        db.session.delete(cart)
+        db.session.commit()
+        return True
+
+    def apply_batch(self, cart_id, operations, products):
+        now = datetime.now()
+        # Create (or touch) the cart, then hold its row lock until commit, so
+        # concurrent adds and batches on the same cart wait for this one
+        # instead of losing increments
+        upsert(Cart.__table__, {'cart_id': cart_id, 'created_at': now, 'updated_at': now},
+               {'updated_at': now}, ['cart_id'])
+        cart = Cart.query.options(selectinload(Cart.items)).filter_by(cart_id=cart_id).with_for_update().first()
+
+        # Existing lines are updated through the ORM; new lines are collected
+        # and written with one multi-row upsert at the end
+        items = {item.product_id: item for item in cart.items}
+        new_items = OrderedDict()
+        for operation in operations:
+            code = operation['product_id']
+            product = products.get(code)
+            cart_item = items.get(product.id) if product else None
+            new_item = new_items.get(product.id) if product else None
+
+            if operation['op'] == 'add':
+                if cart_item:
+                    cart_item.quantity += operation['quantity']
+                    cart_item.price_at_purchase = product.price
+                    cart_item.updated_at = now
+                elif new_item:
+                    new_item['quantity'] += operation['quantity']
+                else:
+                    new_items[product.id] = {
+                        'cart_id': cart.id,
+                        'product_id': product.id,
+                        'product_name': product.product_name,
+                        'quantity': operation['quantity'],
+                        'price_at_purchase': product.price,
+                        'brand_name': product.brand_name,
+                        'generic_name': product.generic_name,
+                        'created_at': now,
+                        'updated_at': now
+                    }
+            elif not cart_item and not new_item:
+                raise ValueError(f"Cart item not found: {code}")
+            elif operation['op'] == 'update':
+                if cart_item:
+                    cart_item.quantity = operation['quantity']
+                    cart_item.updated_at = now
+                else:
+                    new_item['quantity'] = operation['quantity']
+            elif cart_item:
+                cart.items.remove(cart_item)
+                del items[product.id]
+            else:
+                del new_items[product.id]
+
+        if new_items:
+            db.session.flush()
+            table = CartItem.__table__
+            upsert(table, list(new_items.values()), lambda incoming: {
+                'quantity': table.c.quantity + incoming.quantity,
+                'price_at_purchase': incoming.price_at_purchase,
+                'updated_at': incoming.updated_at,
+            }, ['cart_id', 'product_id'])
+        db.session.commit()
+
+    def persist(self, cart_id):
+        return self._get_cart(cart_id)
+
+class KeyValueCartStore(CartStore):
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    # Returns {product_code: line} where line holds the product snapshot
+    def _get_lines(self, cart_id):
+        raise NotImplementedError
+
+    def _snapshot(self, product):
+        return {
+            'productUuid': product.id,
+            'productName': product.product_name,
+            'priceAtPurchase': product.price,
+            'brandName': product.brand_name,
+            'genericName': product.generic_name,
+            'images': [{'productId': image.product_id, 'imgUrl': image.img_url} for image in product.images],
+        }
+
+    def _to_json(self, cart_id, product_code, line):
+        return {
+            'id': None,
+            'cartId': cart_id,
+            'productId': product_code,
+            'productName': line['productName'],
+            'quantity': line['quantity'],
+            'priceAtPurchase': line['priceAtPurchase'],
+            'brandName': line['brandName'],
+            'genericName': line['genericName'],
+            'createdAt': datetime.fromtimestamp(line['createdAt']),
+            'updatedAt': datetime.fromtimestamp(line['updatedAt']),
+            'images': line['images'],
+        }
+
+    def _apply_operations(self, lines, operations, products, now):
+        for operation in operations:
+            code = operation['product_id']
+            line = lines.get(code)
+            if operation['op'] == 'add':
+                snapshot = self._snapshot(products[code])
+                if line:
+                    line.update(snapshot)
+                    line['quantity'] += operation['quantity']
+                    line['updatedAt'] = now
+                else:
+                    lines[code] = dict(snapshot, quantity=operation['quantity'], createdAt=now, updatedAt=now)
+            elif not line:
+                raise ValueError(f"Cart item not found: {code}")
+            elif operation['op'] == 'update':
+                line['quantity'] = operation['quantity']
+                line['updatedAt'] = now
+            else:
+                del lines[code]
+
+    def get_items(self, cart_id):
+        lines = self._get_lines(cart_id)
+        if lines is None:
+            return None
+        return [self._to_json(cart_id, code, line) for code, line in lines.items()]
+
+    def persist(self, cart_id):
+        lines = self._get_lines(cart_id)
+        if not lines:
+            return None
+
+        cart = Cart(cart_id=cart_id)
+        for line in lines.values():
+            cart.items.append(CartItem(
+                product_id=line['productUuid'],
+                product_name=line['productName'],
+                quantity=line['quantity'],
+                price_at_purchase=line['priceAtPurchase'],
+                brand_name=line['brandName'],
+                generic_name=line['genericName'],
+                created_at=datetime.fromtimestamp(line['createdAt']),
+                updated_at=datetime.fromtimestamp(line['updatedAt'])
+            ))
+        db.session.add(cart)
+        db.session.flush()
+        return cart
+
+    def discard(self, cart_id):
+        self.delete_cart(cart_id)
+
+class MemoryCartStore(KeyValueCartStore):
+    SWEEP_EVERY = 1000
+
+    def __init__(self, ttl):
+        super().__init__(ttl)
+        self._carts = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live_cart(self, cart_id, now):
+        entry = self._carts.get(cart_id)
+        if entry and entry['expires'] <= now:
+            del self._carts[cart_id]
+            return None
+        return entry
+
+    def _touch(self, entry, now):
+        entry['expires'] = now + self.ttl
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            expired = [key for key, value in self._carts.items() if value['expires'] <= now]
+            for key in expired:
+                del self._carts[key]
+
+    def _get_lines(self, cart_id):
+        with self._lock:
+            entry = self._live_cart(cart_id, time.time())
+            if entry is None:
+                return None
+            return OrderedDict((code, dict(line)) for code, line in entry['lines'].items())
+
+    def cart_exists(self, cart_id):
+        with self._lock:
+            return self._live_cart(cart_id, time.time()) is not None
+
+    def add_item(self, cart_id, product, quantity):
+        snapshot = self._snapshot(product)
+        with self._lock:
+            now = time.time()
+            entry = self._live_cart(cart_id, now)
+            if entry is None:
+                entry = self._carts[cart_id] = {'lines': OrderedDict(), 'expires': now}
+            line = entry['lines'].get(product.product_id)
+            if line:
+                line.update(snapshot)
+                line['quantity'] += quantity
+                line['updatedAt'] = now
+            else:
+                entry['lines'][product.product_id] = dict(snapshot, quantity=quantity, createdAt=now, updatedAt=now)
+            self._touch(entry, now)
+
+    def set_quantity(self, cart_id, product_code, quantity):
+        with self._lock:
+            now = time.time()
+            entry = self._live_cart(cart_id, now)
+            line = entry['lines'].get(product_code) if entry else None
+            if not line:
+                return False
+            line['quantity'] = quantity
+            line['updatedAt'] = now
+            self._touch(entry, now)
+            return True
+
+    def remove_item(self, cart_id, product_code):
+        with self._lock:
+            now = time.time()
+            entry = self._live_cart(cart_id, now)
+            if not entry or entry['lines'].pop(product_code, None) is None:
+                return False
+            self._touch(entry, now)
+            return True
+
+    def delete_cart(self, cart_id):
+        with self._lock:
+            return self._carts.pop(cart_id, None) is not None
+
+    def apply_batch(self, cart_id, operations, products):
+        with self._lock:
+            now = time.time()
+            entry = self._live_cart(cart_id, now)
+            # Work on a copy so a failing operation leaves the cart untouched
+            lines = OrderedDict((code, dict(line)) for code, line in entry['lines'].items()) if entry else OrderedDict()
+            self._apply_operations(lines, operations, products, now)
+            if entry is None:
+                entry = self._carts[cart_id] = {'lines': lines, 'expires': now}
+            entry['lines'] = lines
+            self._touch(entry, now)
+
+class RedisCartStore(KeyValueCartStore):
+    # Each cart is three hashes keyed by product code: quantities (HINCRBY),
+    # product snapshots and creation times, all sharing one TTL.
+    def __init__(self, client, ttl):
+        super().__init__(ttl)
+        self.client = client
+
+    def _keys(self, cart_id):
+        return f"cart:{cart_id}:qty", f"cart:{cart_id}:lines", f"cart:{cart_id}:created"
+
+    def _expire(self, pipe, cart_id):
+        for key in self._keys(cart_id):
+            pipe.expire(key, self.ttl)
+
+    def _get_lines(self, cart_id):
+        pipe = self.client.pipeline()
+        for key in self._keys(cart_id):
+            pipe.hgetall(key)
+        return self._decode_lines(*pipe.execute())
+
+    def _decode_lines(self, quantities, snapshots, created):
+        if not quantities:
+            return None
+
+        lines = OrderedDict()
+        for code, quantity in sorted(quantities.items(), key=lambda item: float(created.get(item[0], 0))):
+            # A line is only readable with its snapshot; skip any left without
+            # one rather than failing the whole cart
+            if code not in snapshots:
+                continue
+            line = json.loads(snapshots[code])
+            line['quantity'] = int(quantity)
+            line['createdAt'] = float(created.get(code, line['updatedAt']))
+            lines[code.decode('utf-8')] = line
+        return lines
+
+    def cart_exists(self, cart_id):
+        return bool(self.client.exists(self._keys(cart_id)[0]))
+
+    def add_item(self, cart_id, product, quantity):
+        qty_key, lines_key, created_key = self._keys(cart_id)
+        now = time.time()
+        snapshot = dict(self._snapshot(product), updatedAt=now)
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(qty_key, product.product_id, quantity)
+        pipe.hset(lines_key, product.product_id, json.dumps(snapshot))
+        pipe.hsetnx(created_key, product.product_id, now)
+        self._expire(pipe, cart_id)
+        pipe.execute()
+
+    def set_quantity(self, cart_id, product_code, quantity):
+        from redis.exceptions import WatchError
+
+        qty_key, lines_key, _ = self._keys(cart_id)
+        with self.client.pipeline(transaction=True) as pipe:
+            # Optimistic transaction, so a line removed between the check and
+            # the write is not brought back without its snapshot
+            while True:
+                try:
+                    pipe.watch(qty_key, lines_key)
+                    snapshot = pipe.hget(lines_key, product_code)
+                    if snapshot is None or not pipe.hexists(qty_key, product_code):
+                        pipe.unwatch()
+                        return False
+
+                    pipe.multi()
+                    pipe.hset(qty_key, product_code, quantity)
+                    pipe.hset(lines_key, product_code, json.dumps(dict(json.loads(snapshot), updatedAt=time.time())))
+                    self._expire(pipe, cart_id)
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def remove_item(self, cart_id, product_code):
+        pipe = self.client.pipeline(transaction=True)
+        for key in self._keys(cart_id):
+            pipe.hdel(key, product_code)
+        removed = pipe.execute()[0]
+        return bool(removed)
+
+    def delete_cart(self, cart_id):
+        return bool(self.client.delete(*self._keys(cart_id)))
+
+    def apply_batch(self, cart_id, operations, products):
+        from redis.exceptions import WatchError
+
+        keys = self._keys(cart_id)
+        qty_key, lines_key, created_key = keys
+        with self.client.pipeline(transaction=True) as pipe:
+            # Optimistic transaction: retry if another request changed the cart
+            while True:
+                try:
+                    pipe.watch(*keys)
+                    lines = self._decode_lines(*[pipe.hgetall(key) for key in keys]) or OrderedDict()
+                    self._apply_operations(lines, operations, products, time.time())
+
+                    pipe.multi()
+                    pipe.delete(*keys)
+                    if lines:
+                        snapshots = {}
+                        for code, line in lines.items():
+                            snapshot = dict(line)
+                            del snapshot['quantity'], snapshot['createdAt']
+                            snapshots[code] = json.dumps(snapshot)
+                        pipe.hset(qty_key, mapping={code: line['quantity'] for code, line in lines.items()})
+                        pipe.hset(lines_key, mapping=snapshots)
+                        pipe.hset(created_key, mapping={code: line['createdAt'] for code, line in lines.items()})
+                        self._expire(pipe, cart_id)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+def create_cart_store(config):
+    backend = config.get('CART_STORE', 'sql')
+    ttl = config.get('CART_TTL_SECONDS', 7 * 24 * 3600)
+    if backend == 'sql':
+        return SqlCartStore()
+    if backend == 'memory':
+        return MemoryCartStore(ttl)
+    if backend == 'redis':
+        return RedisCartStore(get_redis(config['REDIS_URL']), ttl)
+    raise ValueError(f"Unknown cart store: {backend}")
+
+def get_cart_store():
+    return current_app.extensions['cart_store']
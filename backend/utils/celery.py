@@ -1,17 +1,40 @@
-from celery import Celery
 from celery.schedules import crontab
-from utils.reminder import send_reminder_email_task  # Import the task to register it
+from utils.tasks import celery, task
+import utils.reminder  # Registers the reminder tasks
 
-celery = Celery(
-    'tasks',
-    broker='redis://localhost:6379/0',
-    backend='redis://localhost:6379/0',
-)
+# Worker entry point: celery -A utils.celery worker / beat.
+# Tasks also run in-process when TASK_BACKEND is 'thread' (see utils.tasks).
 
-celery.conf.update(
-    timezone='UTC',
-    enable_utc=True,
-)
+@task('utils.celery.reap_abandoned_carts_task')
+def reap_abandoned_carts_task():
+    from utils.cart_reaper import reap_abandoned_carts
+    return reap_abandoned_carts()
+
+@task('utils.celery.purge_idempotency_keys_task')
+def purge_idempotency_keys_task():
+    from utils.idempotency import purge_expired_idempotency_keys
+    return purge_expired_idempotency_keys()
+
+@task('utils.celery.purge_expired_sessions_task')
+def purge_expired_sessions_task():
+    from utils.sessions import purge_expired_sessions
+    return purge_expired_sessions()
+
+@task('utils.celery.drain_email_outbox_task')
+def drain_email_outbox_task():
+    from utils.outbox import drain_outbox
+    return drain_outbox()
+
+# Backfills or repairs the sales rollups; run on demand, not scheduled
+@task('utils.celery.rebuild_sales_rollups_task')
+def rebuild_sales_rollups_task():
+    from utils.sales_rollup import rebuild_sales_rollups
+    rebuild_sales_rollups()
+
+@task('utils.celery.rebuild_copurchase_index_task')
+def rebuild_copurchase_index_task():
+    from utils.copurchase import rebuild_copurchase_index
+    return rebuild_copurchase_index()
 
 # Schedule the task to run every minute (for testing)
 celery.conf.beat_schedule = {
@@ -21,6 +44,24 @@ celery.conf.beat_schedule = {
         'schedule': crontab(minute='*'),  # Runs every minute
 
     },
+    'drain_email_outbox': {
+        'task': 'utils.celery.drain_email_outbox_task',
+        'schedule': 10.0,  # Runs every 10 seconds
+    },
+    'reap_abandoned_carts_hourly': {
+        'task': 'utils.celery.reap_abandoned_carts_task',
+        'schedule': crontab(minute=15),  # Runs hourly at quarter past
+    },
+    'purge_idempotency_keys_hourly': {
+        'task': 'utils.celery.purge_idempotency_keys_task',
+        'schedule': crontab(minute=45),  # Runs hourly at quarter to
+    },
+    'purge_expired_sessions_hourly': {
+        'task': 'utils.celery.purge_expired_sessions_task',
+        'schedule': crontab(minute=30),  # Runs hourly at half past
+    },
+    'rebuild_copurchase_index_nightly': {
+        'task': 'utils.celery.rebuild_copurchase_index_task',
+        'schedule': crontab(hour=3, minute=0),  # Runs daily at 3am
+    },
 }
-
-celery.autodiscover_tasks(['utils.reminder'])
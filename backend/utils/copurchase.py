@@ -0,0 +1,246 @@
+from flask import current_app
+from sqlalchemy import select, func
+from app.models import db, OrderItem, Products
+from collections import Counter, defaultdict
+from itertools import groupby, permutations
+from array import array
+import numpy as np
+import threading
+import logging
+import copy
+import time
+import os
+
+logger = logging.getLogger('mediscan.copurchase')
+
+# "Frequently bought together" index: for each product, the top-k products
+# that appeared in the same orders, with how many orders they shared.
+#   codes       - product codes, position i is product index i
+#   neighbors   - int32 (n, k) product indexes, -1 where a row has fewer than k
+#   counts      - int32 (n, k) shared order counts, matching neighbors
+#   watermark   - highest order id included in the arrays
+# Orders newer than the watermark are folded into a small in-memory overlay
+# by refreshed(), so the arrays only need rebuilding by the nightly job.
+# An index is never modified once built, so requests read it without locking.
+class CoPurchaseIndex:
+    def __init__(self, codes, neighbors, counts, watermark):
+        self.codes = list(codes)
+        self.index_of = {code: i for i, code in enumerate(self.codes)}
+        self.neighbors = neighbors
+        self.counts = counts
+        self.watermark = watermark
+        self.overlay = {}
+
+    @classmethod
+    def empty(cls, top_k):
+        return cls([], np.full((0, top_k), -1, dtype=np.int32), np.zeros((0, top_k), dtype=np.int32), 0)
+
+    @classmethod
+    def build(cls, top_k, max_order_lines):
+        watermark = db.session.execute(select(func.max(OrderItem.order_id))).scalar() or 0
+        codes = []
+        index_of = {}
+        left = array('i')
+        right = array('i')
+
+        rows = db.session.execute(
+            select(OrderItem.order_id, Products.product_id)
+            .join(Products, Products.id == OrderItem.product_id)
+            .where(OrderItem.order_id <= watermark)
+            .order_by(OrderItem.order_id)
+            .execution_options(yield_per=10000)
+        )
+        for _, lines in groupby(rows, key=lambda row: row.order_id):
+            basket = []
+            for line in lines:
+                i = index_of.get(line.product_id)
+                if i is None:
+                    i = index_of[line.product_id] = len(codes)
+                    codes.append(line.product_id)
+                basket.append(i)
+            # Very large orders say little about affinity and cost O(n^2) pairs
+            basket = sorted(set(basket))[:max_order_lines]
+            for a, b in permutations(basket, 2):
+                left.append(a)
+                right.append(b)
+
+        n = len(codes)
+        neighbors = np.full((n, top_k), -1, dtype=np.int32)
+        counts = np.zeros((n, top_k), dtype=np.int32)
+        if len(left):
+            # Count each (product, co-product) pair, then keep the k largest per product
+            pairs, pair_counts = np.unique(
+                np.frombuffer(left, dtype=np.int32).astype(np.int64) * n + np.frombuffer(right, dtype=np.int32),
+                return_counts=True
+            )
+            row_ids, cols = np.divmod(pairs, n)
+            order = np.lexsort((-pair_counts, row_ids))
+            row_ids, cols, pair_counts = row_ids[order], cols[order], pair_counts[order]
+            starts = np.searchsorted(row_ids, row_ids, side='left')
+            rank = np.arange(len(row_ids)) - starts
+            keep = rank < top_k
+            neighbors[row_ids[keep], rank[keep]] = cols[keep]
+            counts[row_ids[keep], rank[keep]] = pair_counts[keep]
+
+        return cls(codes, neighbors, counts, watermark)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['codes'].tolist(), data['neighbors'], data['counts'], int(data['watermark']))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            codes=np.array(self.codes, dtype='U36'),
+            neighbors=self.neighbors,
+            counts=self.counts,
+            watermark=np.int64(self.watermark)
+        )
+        os.replace(tmp_path, path)
+
+    # A copy of the index with orders placed after the watermark folded into
+    # its overlay; shares the arrays with this one
+    def refreshed(self, max_order_lines):
+        rows = db.session.execute(
+            select(OrderItem.order_id, Products.product_id)
+            .join(Products, Products.id == OrderItem.product_id)
+            .where(OrderItem.order_id > self.watermark)
+            .order_by(OrderItem.order_id)
+        ).all()
+        if not rows:
+            return self
+
+        overlay = defaultdict(Counter, {code: Counter(counts) for code, counts in self.overlay.items()})
+        watermark = self.watermark
+        for order_id, lines in groupby(rows, key=lambda row: row.order_id):
+            basket = sorted({line.product_id for line in lines})[:max_order_lines]
+            for a, b in permutations(basket, 2):
+                overlay[a][b] += 1
+            watermark = order_id
+
+        index = copy.copy(self)
+        index.overlay = dict(overlay)
+        index.watermark = watermark
+        return index
+
+    def _neighbor_counts(self, code):
+        scores = Counter()
+        i = self.index_of.get(code)
+        if i is not None:
+            row = self.neighbors[i]
+            valid = row >= 0
+            for j, count in zip(row[valid].tolist(), self.counts[i][valid].tolist()):
+                scores[self.codes[j]] = count
+        scores.update(self.overlay.get(code, {}))
+        return scores
+
+    # Top co-purchased products for a basket of product codes, excluding the
+    # basket itself, as [(code, count)]
+    def recommend(self, codes, limit):
+        scores = Counter()
+        for code in codes:
+            scores.update(self._neighbor_counts(code))
+        for code in codes:
+            scores.pop(code, None)
+        return scores.most_common(limit)
+
+_index = None
+_index_mtime = None
+_refreshed_at = None
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+# The process-wide index, for serving requests without touching the
+# database. Loading, building and refreshing all happen on a background
+# thread (see refresh_copurchase_index), started when the index is more than
+# COPURCHASE_REFRESH_SECONDS old; until the first load finishes this returns
+# an empty index.
+def get_copurchase_index():
+    start_copurchase_refresh(current_app._get_current_object())
+    index = _index
+    if index is None:
+        return CoPurchaseIndex.empty(current_app.config['COPURCHASE_TOP_K'])
+    return index
+
+# Checked before every request, so web workers load the index when they
+# start serving rather than on their first recommendations request
+def init_copurchase_index(app):
+    @app.before_request
+    def refresh_copurchase_index_if_due():
+        start_copurchase_refresh(app)
+
+# Starts a background refresh if one is due and none is running
+def start_copurchase_refresh(app):
+    global _refresh_thread
+    refreshed_at = _refreshed_at
+    if refreshed_at is not None and time.monotonic() - refreshed_at < app.config['COPURCHASE_REFRESH_SECONDS']:
+        return
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=_refresh_in_background, args=(app,), name='copurchase-refresh', daemon=True)
+        _refresh_thread.start()
+
+def _refresh_in_background(app):
+    global _refreshed_at
+    with app.app_context():
+        try:
+            refresh_copurchase_index()
+        except Exception as e:
+            logger.exception('Could not refresh the co-purchase index: %s', e)
+        finally:
+            db.session.remove()
+    _refreshed_at = time.monotonic()
+
+# Reloads the index when COPURCHASE_INDEX_PATH changes and folds in new
+# orders, then publishes the result for requests
+def refresh_copurchase_index():
+    global _index, _index_mtime
+    config = current_app.config
+    path = config['COPURCHASE_INDEX_PATH']
+    if not os.path.exists(path):
+        build_missing_copurchase_index()
+    if not os.path.exists(path):
+        return
+
+    mtime = os.path.getmtime(path)
+    index = _index
+    if index is None or mtime != _index_mtime:
+        index = CoPurchaseIndex.load(path)
+        _index_mtime = mtime
+    _index = index.refreshed(config['COPURCHASE_MAX_ORDER_LINES'])
+
+# Writes the index file on a fresh install, before the first nightly
+# rebuild. Workers starting together race for a lock file so that only one
+# of them scans the order history; a lock older than
+# COPURCHASE_BUILD_LOCK_SECONDS is taken to be left by a crashed worker.
+def build_missing_copurchase_index():
+    config = current_app.config
+    lock_path = f"{config['COPURCHASE_INDEX_PATH']}.lock"
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(lock_path) > config['COPURCHASE_BUILD_LOCK_SECONDS']:
+            os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return
+    try:
+        rebuild_copurchase_index()
+    finally:
+        os.remove(lock_path)
+
+# Rebuilds the index from all order history and writes it for the web workers
+def rebuild_copurchase_index():
+    config = current_app.config
+    start = time.perf_counter()
+    index = CoPurchaseIndex.build(config['COPURCHASE_TOP_K'], config['COPURCHASE_MAX_ORDER_LINES'])
+    index.save(config['COPURCHASE_INDEX_PATH'])
+    logger.info('Rebuilt co-purchase index: %d products up to order %d in %.1f s',
+                len(index.codes), index.watermark, time.perf_counter() - start)
+    return {'products': len(index.codes), 'watermark': index.watermark}
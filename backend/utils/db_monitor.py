@@ -0,0 +1,153 @@
+from flask import has_request_context, request, g
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from collections import Counter
+from utils.status import handle_error
+import threading
+import logging
+import time
+import re
+
+slow_query_logger = logging.getLogger('mediscan.slow_query')
+query_logger = logging.getLogger('mediscan.queries')
+
+# Collapses bound IN lists so "IN (?, ?)" and "IN (?, ?, ?)" share one shape
+IN_LIST_PATTERN = re.compile(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))+\s*\)')
+
+# Pool wait statistics shared by every worker thread in this process
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.connections_created = 0
+            self.connections_invalidated = 0
+            self.slow_queries = 0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            if seconds > self.max_wait:
+                self.max_wait = seconds
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'avgCheckoutWaitMs': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'maxCheckoutWaitMs': round(self.max_wait * 1000, 3),
+                'connectionsCreated': self.connections_created,
+                'connectionsInvalidated': self.connections_invalidated,
+                'slowQueries': self.slow_queries,
+            }
+
+pool_stats = PoolStats()
+
+# QueuePool that records how long each checkout waited for a connection
+class MonitoredQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+# SQL statements issued while serving a single request
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+def statement_shape(statement):
+    return IN_LIST_PATTERN.sub('(?)', ' '.join(statement.split()))
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return None
+
+def init_db_monitor(app, engine):
+    threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 200) / 1000.0
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        if has_request_context() and 'query_stats' in g:
+            g.query_stats.record(statement, elapsed)
+        if elapsed >= threshold:
+            pool_stats.incr('slow_queries')
+            slow_query_logger.warning(
+                'Slow query (%.1f ms) on %s: %s',
+                elapsed * 1000, _current_endpoint(), ' '.join(statement.split())
+            )
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.incr('connections_created')
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats.incr('connections_invalidated')
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = RequestQueryStats()
+
+    @app.after_request
+    def finish_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-DB-Time-Ms'] = f"{stats.total_time * 1000:.1f}"
+
+        for shape, n in stats.repeated(app.config.get('N_PLUS_ONE_THRESHOLD', 5)):
+            query_logger.warning('Possible N+1 on %s: %d x %s', request.endpoint, n, shape)
+
+        # Budgets are only enforced in test mode so regressions fail loudly there
+        enforce = app.config.get('QUERY_BUDGET_ENFORCE') or app.testing
+        budget = app.config.get('QUERY_BUDGETS', {}).get(request.endpoint, app.config.get('QUERY_BUDGET_DEFAULT'))
+        if enforce and budget is not None and stats.count > budget:
+            error_response, status_code = handle_error(
+                f"Query budget exceeded for {request.endpoint}: {stats.count} > {budget}", 500
+            )
+            error_response.status_code = status_code
+            return error_response
+        return response
+
+def get_pool_status(engine):
+    pool = engine.pool
+    status = {'pool': pool.status()}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checkedIn': pool.checkedin(),
+            'checkedOut': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+    status.update(pool_stats.to_json())
+    return status
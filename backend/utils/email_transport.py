@@ -0,0 +1,130 @@
+from flask import current_app
+import requests
+import threading
+import json
+import os
+import re
+
+SENDGRID_SEND_URL = 'https://api.sendgrid.com/v3/mail/send'
+
+class EmailSendError(Exception):
+    # status_code is the provider's HTTP status, if it answered
+    def __init__(self, message, retryable=True, status_code=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = status_code
+
+def apply_substitutions(html_content, substitutions):
+    for tag, value in substitutions.items():
+        html_content = html_content.replace(tag, value)
+    return html_content
+
+# Delivers messages; raises EmailSendError on failure
+class EmailTransport:
+    def send(self, to_email, subject, html_content):
+        raise NotImplementedError
+
+    # One shared body for many recipients, each with its own substitutions
+    # ({tag: value}), as [(to_email, substitutions)]. Providers without a
+    # bulk API fall back to rendering and sending each message here.
+    def send_bulk(self, subject, html_content, recipients):
+        for to_email, substitutions in recipients:
+            self.send(to_email, subject, apply_substitutions(html_content, substitutions))
+
+# SendGrid v3 API over one pooled keep-alive HTTPS session per process
+class SendGridTransport(EmailTransport):
+    def __init__(self, api_key, from_email, timeout):
+        self.from_email = from_email
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f"Bearer {api_key}",
+            'Content-Type': 'application/json',
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        self.session.mount('https://', adapter)
+
+    def send(self, to_email, subject, html_content):
+        self._post({
+            'personalizations': [{'to': [{'email': to_email}]}],
+            'from': {'email': self.from_email},
+            'subject': subject,
+            'content': [{'type': 'text/html', 'value': html_content}],
+        })
+
+    # One API call for the whole batch; SendGrid applies each
+    # personalization's substitutions to the shared content
+    def send_bulk(self, subject, html_content, recipients):
+        self._post({
+            'personalizations': [
+                {'to': [{'email': to_email}], 'substitutions': substitutions}
+                for to_email, substitutions in recipients
+            ],
+            'from': {'email': self.from_email},
+            'subject': subject,
+            'content': [{'type': 'text/html', 'value': html_content}],
+        })
+
+    def _post(self, payload):
+        try:
+            response = self.session.post(SENDGRID_SEND_URL, data=json.dumps(payload), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise EmailSendError(f"SendGrid request failed: {str(e)}")
+
+        if response.status_code >= 300:
+            # Throttling and server errors are worth retrying; other client errors are not
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise EmailSendError(f"SendGrid returned {response.status_code}: {response.text[:500]}", retryable, response.status_code)
+
+# Keeps sent messages in a list, for tests; api_calls counts send/send_bulk calls
+class MemoryTransport(EmailTransport):
+    def __init__(self):
+        self.sent = []
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, to_email, subject, html_content):
+        with self._lock:
+            self.api_calls += 1
+            self.sent.append({'to': to_email, 'subject': subject, 'html': html_content})
+
+    def send_bulk(self, subject, html_content, recipients):
+        with self._lock:
+            self.api_calls += 1
+            for to_email, substitutions in recipients:
+                self.sent.append({'to': to_email, 'subject': subject, 'html': apply_substitutions(html_content, substitutions)})
+
+# Writes each message to an .html file, for local development
+class FileTransport(EmailTransport):
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def send(self, to_email, subject, html_content):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._count += 1
+            count = self._count
+        safe_to = re.sub(r'[^\w.@-]', '_', to_email)
+        path = os.path.join(self.directory, f"{os.getpid()}-{count:06d}-{safe_to}.html")
+        with open(path, 'w') as file:
+            file.write(f"<!-- To: {to_email} -->\n<!-- Subject: {subject} -->\n{html_content}")
+
+_transports = {}
+
+def get_email_transport():
+    config = current_app.config
+    name = config['EMAIL_TRANSPORT']
+    transport = _transports.get(name)
+    if transport is None:
+        if name == 'sendgrid':
+            transport = SendGridTransport(config['SENDGRID_API_KEY'], config['MAIL_FROM'], config['SENDGRID_TIMEOUT'])
+        elif name == 'memory':
+            transport = MemoryTransport()
+        elif name == 'file':
+            transport = FileTransport(config['EMAIL_FILE_DIR'])
+        else:
+            raise ValueError(f"Unknown EMAIL_TRANSPORT: {name}")
+        _transports[name] = transport
+    return transport
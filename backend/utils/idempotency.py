@@ -0,0 +1,170 @@
+from functools import wraps
+from flask import request, make_response, current_app
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.exc import IntegrityError
+from app.models import db, IdempotencyKey
+from utils.status import handle_error
+from datetime import datetime, timedelta
+import hashlib
+import logging
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+logger = logging.getLogger('mediscan.idempotency')
+
+def _lookup(scope, key):
+    return db.session.execute(
+        select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+    ).scalar_one_or_none()
+
+def _lease_end(now):
+    return now + timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_SECONDS'])
+
+# Inserts the in-flight placeholder; the unique (scope, key) constraint makes
+# sure only one of several concurrent retries gets to run the view.
+def _claim(scope, key, request_hash, now):
+    ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_TTL_SECONDS'])
+    try:
+        db.session.add(IdempotencyKey(
+            scope=scope,
+            key=key,
+            request_hash=request_hash,
+            locked_until=_lease_end(now),
+            created_at=now,
+            expires_at=now + ttl
+        ))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+# Takes over an in-flight key whose lease has run out. The conditional update
+# lets only one of several concurrent retries win.
+def _reclaim(record, now):
+    try:
+        result = db.session.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.id == record.id,
+                IdempotencyKey.status_code.is_(None),
+                or_(IdempotencyKey.locked_until.is_(None), IdempotencyKey.locked_until <= now)
+            )
+            .values(locked_until=_lease_end(now))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _release(scope, key):
+    try:
+        db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('Failed to release idempotency key %s/%s: %s', scope, key, e)
+
+def _store(scope, key, response):
+    try:
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            .values(
+                status_code=response.status_code,
+                response_body=response.get_data(as_text=True),
+                content_type=response.content_type,
+                locked_until=None
+            )
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('Failed to store idempotent response for %s/%s: %s', scope, key, e)
+
+def _replay(record):
+    response = make_response(record.response_body, record.status_code)
+    response.content_type = record.content_type
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+# Makes a POST route safe to retry. The first request carrying a given
+# Idempotency-Key header runs the view and its response is stored for
+# IDEMPOTENCY_TTL_SECONDS; retries with the same key get the stored response
+# back after a single lookup. A retry arriving while the first request is
+# still running gets 409, until IDEMPOTENCY_LOCK_SECONDS have passed; the
+# first request is then presumed dead and the retry runs the view in its
+# place. Requests without the header are not affected.
+# Server errors are not stored, so the client can retry them.
+def idempotent(scope):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 255:
+                return handle_error('Idempotency-Key must be at most 255 characters', 400)
+
+            request_hash = hashlib.sha256(request.get_data()).hexdigest()
+            now = datetime.now()
+
+            record = _lookup(scope, key)
+            if record is not None and record.expires_at <= now:
+                _release(scope, key)
+                record = None
+
+            if record is None and not _claim(scope, key, request_hash, now):
+                record = _lookup(scope, key)
+                if record is None:
+                    return handle_error('A request with this Idempotency-Key is in progress', 409)
+
+            if record is not None:
+                if record.request_hash != request_hash:
+                    return handle_error('Idempotency-Key was already used for a different request', 422)
+                if record.status_code is not None:
+                    return _replay(record)
+                if (record.locked_until is not None and record.locked_until > now) or not _reclaim(record, now):
+                    return handle_error('A request with this Idempotency-Key is in progress', 409)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                _release(scope, key)
+                raise
+
+            if response.status_code >= 500:
+                _release(scope, key)
+            else:
+                _store(scope, key, response)
+            return response
+        return wrapper
+    return decorator
+
+# Deletes expired keys in batches, each in its own short transaction
+def purge_expired_idempotency_keys(batch_size=500):
+    now = datetime.now()
+    purged = 0
+    while True:
+        ids = db.session.execute(
+            select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= now).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        try:
+            result = db.session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        purged += result.rowcount
+
+    logger.info('Purged %d expired idempotency keys', purged)
+    return purged
@@ -1,11 +1,45 @@
 from flask import current_app
+from utils.token_revocation import get_revocation_store
+from datetime import datetime, timedelta, timezone
 import jwt
+import uuid
 
-blacklist = set()
+class RevokedTokenError(jwt.InvalidTokenError):
+    pass
 
+# Every token carries a unique id (jti) so it can be revoked, and expires
+# after JWT_TTL_SECONDS
 def generate_jwt(data):
-    token = jwt.encode(data, current_app.config['SECRET_KEY'], algorithm='HS256')
+    now = datetime.now(timezone.utc)
+    payload = dict(data, jti=uuid.uuid4().hex, iat=now, exp=now + timedelta(seconds=current_app.config['JWT_TTL_SECONDS']))
+    token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
     return token
 
-def blacklist_jwt(token):
-    return token in blacklist
\ No newline at end of file
+# Verifies a token and returns its claims. Raises jwt.ExpiredSignatureError,
+# RevokedTokenError or another jwt.InvalidTokenError.
+def decode_jwt(token):
+    data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'], options={'require': ['exp', 'jti']})
+    if get_revocation_store().is_revoked(data['jti']):
+        raise RevokedTokenError('Token has been revoked')
+    return data
+
+# Revokes a token for the rest of its life. Returns False if the token is
+# not valid (already expired, revoked or malformed).
+def revoke_jwt(token):
+    try:
+        data = decode_jwt(token)
+    except jwt.InvalidTokenError:
+        return False
+    get_revocation_store().revoke(data['jti'], data['exp'])
+    return True
+
+# Whether a token has been revoked; False for tokens that are otherwise
+# invalid (expired or malformed)
+def is_revoked(token):
+    try:
+        decode_jwt(token)
+    except RevokedTokenError:
+        return True
+    except jwt.InvalidTokenError:
+        pass
+    return False
@@ -1,50 +1,73 @@
 from flask import current_app
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.orm import selectinload
 from app.app import db
 from datetime import datetime
-from app.models import Order, OrderItem
-import ssl
-import os
+from app.models import Order, OrderItem, Cart, CartItem, Products
+from utils.sales_rollup import record_order_sales
 
-def create_order_from_cart(customer_id, cart, order_number, total_price):
+# Subtotal, shipping fee and total for a list of cart lines
+def calculate_order_total(items):
+    subtotal = round(sum(item.price_at_purchase * item.quantity for item in items), 2)
+    if subtotal >= current_app.config['FREE_SHIPPING_THRESHOLD']:
+        shipping_fee = 0.0
+    else:
+        shipping_fee = current_app.config['SHIPPING_FEE']
+    return subtotal, shipping_fee, round(subtotal + shipping_fee, 2)
+
+# Creates the order, bulk-inserts its lines and deletes the cart in one
+# transaction, so a failure never leaves a half-created order behind.
+def create_order_from_cart(customer_id, cart, order_number):
     try:
+        items = cart.items
+        if not items:
+            raise ValueError('Cart is empty')
+
+        now = datetime.now()
+        _, _, total_price = calculate_order_total(items)
+
         # Create a new order
         order = Order(
             order_number=order_number,
             customer_id=customer_id,
             total_price=total_price,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
+            created_at=now,
+            updated_at=now
         )
         db.session.add(order)
-        db.session.commit()
-
-        # Create order items
-        order_items = []
-        for item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                quantity=item.quantity,
-                price_at_purchase=item.price_at_purchase,
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-            db.session.add(order_item)
-            order_items.append(order_item)
+        db.session.flush()
 
-        db.session.commit()
+        # Create order items with a single executemany insert
+        lines = [
+            {
+                'order_id': order.id,
+                'product_id': item.product_id,
+                'product_name': item.product_name,
+                'quantity': item.quantity,
+                'price_at_purchase': item.price_at_purchase,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for item in items
+        ]
+        db.session.execute(insert(OrderItem), lines)
+        record_order_sales(order, lines)
 
         # Clear the cart
-        for item in cart.items:
-            db.session.delete(item)
-        db.session.delete(cart)
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
+        db.session.execute(delete(Cart).where(Cart.id == cart.id))
         db.session.commit()
 
         # Convert to JSON
+        product_codes = dict(db.session.execute(
+            select(Products.id, Products.product_id).where(Products.id.in_({item.product_id for item in items}))
+        ).all())
+        order_items = OrderItem.query.filter_by(order_id=order.id).order_by(OrderItem.id).all()
+        items_json = [item.to_json(product_codes.get(item.product_id)) for item in order_items]
+
         order_data = {
-            'order': order.to_json(),
-            'items': [item.to_json() for item in order_items]
+            'order': order.to_json(items_json),
+            'items': items_json
         }
 
         return order_data
@@ -52,3 +75,112 @@ def create_order_from_cart(customer_id, cart, order_number, total_price):
         db.session.rollback()
         raise e
 
+# One page of order headers, newest first. Item counts come from a single
+# aggregate query; the product codes for the list thumbnails from a second
+# query bounded by the page size. The cursor is the id of the last order on
+# the previous page.
+def get_order_summaries(customer_id, cursor=None, limit=20):
+    stmt = (
+        select(
+            Order.id,
+            Order.order_number,
+            Order.total_price,
+            Order.created_at,
+            func.count(OrderItem.id).label('item_count'),
+            func.coalesce(func.sum(OrderItem.quantity), 0).label('total_quantity')
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.customer_id == customer_id)
+        .group_by(Order.id, Order.order_number, Order.total_price, Order.created_at)
+        .order_by(Order.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Order.id < cursor)
+
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    product_codes = {row.id: [] for row in rows}
+    if rows:
+        lines = db.session.execute(
+            select(OrderItem.order_id, Products.product_id)
+            .join(Products, Products.id == OrderItem.product_id)
+            .where(OrderItem.order_id.in_(product_codes.keys()))
+            .order_by(OrderItem.id)
+        ).all()
+        for order_id, product_code in lines:
+            product_codes[order_id].append(product_code)
+
+    orders = [
+        {
+            'id': row.id,
+            'orderNumber': row.order_number,
+            'totalPrice': row.total_price,
+            'createdAt': row.created_at,
+            'itemCount': row.item_count,
+            'totalQuantity': int(row.total_quantity),
+            'productIds': product_codes[row.id]
+        }
+        for row in rows
+    ]
+    next_cursor = rows[-1].id if has_more else None
+
+    return orders, next_cursor
+
+# A single order with its lines, or None if it does not belong to the customer
+def get_order_detail(customer_id, order_number):
+    order = Order.query.filter_by(order_number=order_number, customer_id=customer_id).first()
+    if not order:
+        return None
+
+    lines = db.session.execute(
+        select(OrderItem, Products.product_id)
+        .join(Products, Products.id == OrderItem.product_id)
+        .where(OrderItem.order_id == order.id)
+        .order_by(OrderItem.id)
+    ).all()
+
+    return order.to_json([item.to_json(product_code) for item, product_code in lines])
+
+# Cart operations that re-add the lines of a past order at current prices.
+# The order lines and the current product rows (price, stock) are read with
+# one joined query. Lines that cannot be fulfilled in full are reported in
+# `unavailable`, including lines whose product has since been deleted; a
+# line with some stock left is added with what remains.
+# Returns None if the order does not belong to the customer.
+def build_reorder(customer_id, order_number):
+    order_id = db.session.execute(
+        select(Order.id).where(Order.order_number == order_number, Order.customer_id == customer_id)
+    ).scalar()
+    if order_id is None:
+        return None
+
+    lines = db.session.execute(
+        select(OrderItem.quantity, OrderItem.product_name, Products)
+        .outerjoin(Products, Products.id == OrderItem.product_id)
+        .where(OrderItem.order_id == order_id)
+        .order_by(OrderItem.id)
+        .options(selectinload(Products.images))
+    ).all()
+
+    operations = []
+    products = {}
+    unavailable = []
+    for quantity, product_name, product in lines:
+        if product is None:
+            unavailable.append({'productId': None, 'productName': product_name, 'quantity': quantity, 'reason': 'discontinued'})
+            continue
+        code = product.product_id
+        if not product.price or product.stock <= 0:
+            unavailable.append({'productId': code, 'productName': product_name, 'quantity': quantity, 'reason': 'out_of_stock'})
+            continue
+        if product.stock < quantity:
+            unavailable.append({'productId': code, 'productName': product_name, 'quantity': quantity - product.stock, 'reason': 'insufficient_stock'})
+            quantity = product.stock
+
+        operations.append({'op': 'add', 'product_id': code, 'quantity': quantity})
+        products[code] = product
+
+    return operations, products, unavailable
@@ -1,14 +1,16 @@
 from flask import current_app
 # from twilio.rest import Client
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from sqlalchemy import update
 from app.app import db
+from app.models import Customers
 from datetime import datetime, timedelta
 from utils.status import handle_error, handle_success
 from utils.validation import get_customer_by_contact, is_valid_email
+from utils.outbox import queue_email, send_queued_emails
 from flask_bcrypt import Bcrypt
-import random
-import ssl
+import secrets
+import hashlib
+import hmac
 
 bcrypt = Bcrypt()
 def get_pepper():
@@ -16,20 +18,46 @@ def get_pepper():
 
 # Create an OTP
 def create_temp_password():
-    return ''.join([str(random.randint(0, 9)) for _ in range(6)])
-
-# Send an OTP via email
-def send_email(email, message):
-    message = Mail(
-        from_email=current_app.config['MAIL_FROM'],
-        to_emails=email,
-        subject='Your OTP Code',
-        html_content=message
-    )
-    ssl._create_default_https_context = ssl._create_unverified_context
-    sg = SendGridAPIClient(current_app.config['SENDGRID_API_KEY'])
-    response = sg.send(message)
-    return response.status_code
+    return f"{secrets.randbelow(10 ** 6):06d}"
+
+# OTPs only live for minutes and are guarded by OTP_MAX_ATTEMPTS, so a keyed
+# HMAC is enough to keep them unreadable at rest, at a fraction of bcrypt's
+# CPU cost. Stored as 'hmac$<hex digest>'.
+OTP_HMAC_PREFIX = 'hmac$'
+
+def hash_otp(otp):
+    key = get_pepper().encode('utf-8')
+    return OTP_HMAC_PREFIX + hmac.new(key, otp.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def check_otp_hash(stored, otp):
+    if stored.startswith(OTP_HMAC_PREFIX):
+        return hmac.compare_digest(stored, hash_otp(otp))
+    # bcrypt hashes from before the switch to HMAC, until they expire
+    return bcrypt.check_password_hash(stored, otp + get_pepper())
+
+# Checks a customer's pending OTP. Each check uses up one of OTP_MAX_ATTEMPTS,
+# counted atomically so concurrent guesses cannot exceed the limit.
+# Returns None on success, otherwise an error message and status code.
+def verify_temp_password(customer, otp):
+    if not customer.temporary_password or not otp:
+        return 'Invalid OTP', 400
+
+    if customer.password_expiry is None or datetime.now() > customer.password_expiry:
+        return 'OTP expired', 400
+
+    counted = db.session.execute(
+        update(Customers)
+        .where(Customers.id == customer.id, Customers.otp_attempts < current_app.config['OTP_MAX_ATTEMPTS'])
+        .values(otp_attempts=Customers.otp_attempts + 1)
+    ).rowcount
+    db.session.commit()
+    if not counted:
+        return 'Too many attempts. Please request a new OTP.', 429
+
+    if not check_otp_hash(customer.temporary_password, otp):
+        return 'Invalid OTP', 400
+
+    return None
 
 # Request OTP
 RATE_LIMIT_TIME_FRAME = timedelta(minutes=1)
@@ -45,17 +73,16 @@ def request_temp_password(contact):
     temp_password = create_temp_password()
     temp_password_expiry = datetime.now() + timedelta(minutes=5)
 
-    pepper = get_pepper()
-    temp_password_with_pepper = (temp_password + pepper).encode('utf-8')
-    hashed_temp_password = bcrypt.generate_password_hash(temp_password_with_pepper).decode('utf-8')
-
-    customer.temporary_password = hashed_temp_password
+    customer.temporary_password = hash_otp(temp_password)
     customer.password_expiry = temp_password_expiry
+    customer.otp_attempts = 0
     customer.last_otp_request = datetime.now()
-    db.session.commit()
 
+    # Queued in the same transaction as the new OTP; the outbox worker sends it
     message = f"Your verification code is {temp_password}. It will expire in 5 minutes."
     if is_valid_email(contact):
-        send_email(customer.email, message)
+        queue_email(customer.email, 'Your OTP Code', message, 'otp')
+    db.session.commit()
+    send_queued_emails()
 
     return handle_success('Temporary password sent')
\ No newline at end of file
@@ -0,0 +1,189 @@
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from app.models import db, EmailOutbox, EmailBulkBody
+from utils.email_transport import get_email_transport, apply_substitutions, EmailSendError
+from utils.rate_limit import get_rate_limiter
+from utils.tasks import enqueue
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+import json
+
+logger = logging.getLogger('mediscan.outbox')
+
+# Adds an email to the outbox in the caller's transaction; it is only sent
+# once the caller commits
+def queue_email(to_email, subject, html_content, category):
+    db.session.add(EmailOutbox(
+        category=category,
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+        status='pending',
+        next_attempt_at=datetime.now()
+    ))
+
+# Stores a body shared by many queued emails; pass it to queue_bulk_email
+def create_bulk_body(html_content):
+    bulk_body = EmailBulkBody(html_content=html_content)
+    db.session.add(bulk_body)
+    return bulk_body
+
+# Queues one recipient of a bulk body. substitutions maps tags in the body to
+# this recipient's (already escaped) values. Recipients of the same body are
+# sent together, many per provider API call.
+def queue_bulk_email(to_email, subject, bulk_body, substitutions, category):
+    db.session.add(EmailOutbox(
+        category=category,
+        to_email=to_email,
+        subject=subject,
+        bulk_body=bulk_body,
+        substitutions=json.dumps(substitutions),
+        status='pending',
+        next_attempt_at=datetime.now()
+    ))
+
+# Asks a background worker to send queued email now instead of at its next
+# scheduled drain. Call after committing; if the task cannot be queued the
+# scheduled drain still sends the email.
+def send_queued_emails():
+    try:
+        enqueue('utils.celery.drain_email_outbox_task')
+    except Exception as e:
+        logger.warning('Could not queue an outbox drain: %s', e)
+
+def _retry_delay(attempts):
+    config = current_app.config
+    return min(config['EMAIL_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), config['EMAIL_RETRY_MAX_SECONDS'])
+
+# Claims up to batch_size due messages by pushing their next attempt past the
+# send lease. Concurrent workers skip rows another worker has locked, and a
+# worker that dies mid-batch leaves its rows to be picked up after the lease.
+def _claim_batch(batch_size):
+    now = datetime.now()
+    lease = timedelta(seconds=current_app.config['EMAIL_SEND_LEASE_SECONDS'])
+    try:
+        ids = db.session.execute(
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if ids:
+            db.session.execute(
+                update(EmailOutbox).where(EmailOutbox.id.in_(ids)).values(next_attempt_at=now + lease)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids
+
+def _record_sent(message, summary):
+    message.status = 'sent'
+    message.sent_at = datetime.now()
+    message.last_error = None
+    summary['sent'] += 1
+
+def _record_failure(message, error, summary):
+    message.last_error = str(error)
+    if not error.retryable or message.attempts >= current_app.config['EMAIL_MAX_ATTEMPTS']:
+        message.status = 'failed'
+        summary['failed'] += 1
+        logger.error('Giving up on email %d to %s: %s', message.id, message.to_email, error)
+    else:
+        message.next_attempt_at = datetime.now() + timedelta(seconds=_retry_delay(message.attempts))
+        summary['retried'] += 1
+
+# Holds every provider API call to the global EMAIL_SEND_RATE, shared across
+# workers when the rate limiter is backed by Redis
+def _throttle():
+    config = current_app.config
+    if config['EMAIL_SEND_RATE'] > 0:
+        get_rate_limiter().wait('email:send', config['EMAIL_SEND_RATE'], config['EMAIL_SEND_BURST'])
+
+def _send_single(transport, message, html_content, summary):
+    try:
+        _throttle()
+        transport.send(message.to_email, message.subject, html_content)
+        _record_sent(message, summary)
+    except EmailSendError as e:
+        _record_failure(message, e, summary)
+
+# Recipients of one bulk body go out EMAIL_BULK_BATCH_SIZE per API call. A
+# recipient whose substitutions are too large for the provider is rendered
+# here and sent on its own.
+def _send_bulk_group(transport, bulk_body, subject, messages, summary):
+    config = current_app.config
+    bulk = []
+    for message in messages:
+        substitutions = json.loads(message.substitutions)
+        if sum(len(tag) + len(value.encode('utf-8')) for tag, value in substitutions.items()) > config['EMAIL_MAX_SUBSTITUTION_BYTES']:
+            _send_single(transport, message, apply_substitutions(bulk_body.html_content, substitutions), summary)
+        else:
+            bulk.append((message, substitutions))
+
+    batch_size = config['EMAIL_BULK_BATCH_SIZE']
+    for start in range(0, len(bulk), batch_size):
+        _send_bulk_batch(transport, bulk_body, subject, bulk[start:start + batch_size], summary)
+
+# The provider rejects a whole bulk request with 400 when any one recipient
+# is invalid (e.g. a malformed address). The batch is then split in half and
+# each half sent again, until only the invalid recipients are left to fail.
+def _send_bulk_batch(transport, bulk_body, subject, batch, summary):
+    try:
+        _throttle()
+        transport.send_bulk(subject, bulk_body.html_content, [
+            (message.to_email, substitutions) for message, substitutions in batch
+        ])
+    except EmailSendError as e:
+        if e.status_code == 400 and len(batch) > 1:
+            middle = len(batch) // 2
+            _send_bulk_batch(transport, bulk_body, subject, batch[:middle], summary)
+            _send_bulk_batch(transport, bulk_body, subject, batch[middle:], summary)
+        else:
+            for message, _ in batch:
+                _record_failure(message, e, summary)
+        return
+
+    for message, _ in batch:
+        _record_sent(message, summary)
+
+# Sends due outbox messages in batches of EMAIL_BATCH_SIZE. Messages sharing
+# a bulk body are submitted together through the provider's bulk API.
+# Failed sends are retried with exponential backoff up to EMAIL_MAX_ATTEMPTS;
+# errors the provider reports as permanent fail the message straight away.
+def drain_outbox(batch_size=None, max_batches=None):
+    config = current_app.config
+    batch_size = batch_size or config['EMAIL_BATCH_SIZE']
+    transport = get_email_transport()
+    summary = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+
+    while max_batches is None or summary['batches'] < max_batches:
+        ids = _claim_batch(batch_size)
+        if not ids:
+            break
+
+        messages = EmailOutbox.query.options(joinedload(EmailOutbox.bulk_body)).filter(
+            EmailOutbox.id.in_(ids)
+        ).order_by(EmailOutbox.id).all()
+
+        bulk_groups = defaultdict(list)
+        for message in messages:
+            message.attempts += 1
+            if message.bulk_body is None:
+                _send_single(transport, message, message.html_content, summary)
+            else:
+                bulk_groups[(message.bulk_body_id, message.subject)].append(message)
+
+        for (_, subject), group in bulk_groups.items():
+            _send_bulk_group(transport, group[0].bulk_body, subject, group, summary)
+
+        db.session.commit()
+        summary['batches'] += 1
+
+    if summary['batches']:
+        logger.info('Outbox drained: %(sent)d sent, %(retried)d to retry, %(failed)d failed', summary)
+    return summary
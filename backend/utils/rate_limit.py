@@ -0,0 +1,164 @@
+from flask import current_app, request
+from utils.redis_client import get_redis
+from utils.status import handle_error
+from collections import OrderedDict
+import functools
+import threading
+import math
+import time
+
+# Token bucket rate limiting, selected with Config.RATE_LIMIT_STORE:
+#   'memory' - buckets live in this process, so limits are per worker
+#   'redis'  - buckets live in Redis and are shared by every worker
+# A bucket holds up to `capacity` tokens and refills at `rate` tokens per
+# second. take() spends tokens if the bucket has enough and returns 0,
+# otherwise it spends nothing and returns the seconds until it will.
+# take_all() does the same for several (key, rate, capacity) buckets at
+# once: tokens are spent from all of them or from none.
+
+class RateLimiter:
+    def take(self, key, rate, capacity, tokens=1):
+        return self.take_all([(key, rate, capacity)], tokens)
+
+    def take_all(self, buckets, tokens=1):
+        raise NotImplementedError
+
+    # Blocks until the tokens are granted
+    def wait(self, key, rate, capacity, tokens=1):
+        while True:
+            delay = self.take(key, rate, capacity, tokens)
+            if not delay:
+                return
+            time.sleep(delay)
+
+class MemoryRateLimiter(RateLimiter):
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_all(self, buckets, tokens=1):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            delay = 0.0
+            for key, rate, capacity in buckets:
+                available, updated_at = self._buckets.pop(key, (capacity, now))
+                available = min(capacity, available + (now - updated_at) * rate)
+                if available < tokens:
+                    delay = max(delay, (tokens - available) / rate)
+                levels.append((key, available))
+            for key, available in levels:
+                self._buckets[key] = (available if delay else available - tokens, now)
+            # A forgotten bucket is equivalent to a full one, so evicting the
+            # least recently used only ever errs towards allowing requests
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return delay
+
+# Refills and spends atomically in one round trip, using the Redis clock so
+# workers on different hosts agree on elapsed time. Idle buckets expire once
+# they would have refilled completely. ARGV is the token count followed by
+# each key's rate and capacity.
+TAKE_SCRIPT = """
+local requested = tonumber(ARGV[1])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local delay = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local available = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated_at) * rate)
+    if available < requested then
+        delay = math.max(delay, (requested - available) / rate)
+    end
+    levels[i] = available
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local available = levels[i]
+    if delay == 0 then
+        available = available - requested
+    end
+    redis.call('HSET', key, 'tokens', tostring(available), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+return tostring(delay)
+"""
+
+class RedisRateLimiter(RateLimiter):
+    def __init__(self, client, prefix='ratelimit:'):
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take_all(self, buckets, tokens=1):
+        keys = []
+        args = [tokens]
+        for key, rate, capacity in buckets:
+            keys.append(self.prefix + key)
+            args.extend([rate, capacity])
+        return float(self._take(keys=keys, args=args))
+
+def create_rate_limiter(config):
+    backend = config.get('RATE_LIMIT_STORE', 'memory')
+    if backend == 'memory':
+        return MemoryRateLimiter()
+    if backend == 'redis':
+        return RedisRateLimiter(get_redis(config['REDIS_URL']))
+    raise ValueError(f"Unknown rate limit store: {backend}")
+
+def get_rate_limiter():
+    return current_app.extensions['rate_limiter']
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# '10/minute' -> (refill rate per second, capacity): the bucket allows a burst
+# of the full amount, then refills evenly over the period
+@functools.lru_cache(maxsize=None)
+def parse_limit(limit):
+    amount, period = limit.split('/')
+    return int(amount) / PERIODS[period], int(amount)
+
+# Who a rule's bucket belongs to. remote_addr is the client address as seen
+# by Flask, so deployments behind a proxy need ProxyFix for per-IP limits.
+def _rate_limit_identity(scope):
+    if scope == 'route':
+        return 'all'
+    if scope == 'principal':
+        from utils.auth import get_claims, AuthError
+        for kind in ('customer', 'employee'):
+            try:
+                return f"{kind}:{get_claims(kind)[kind + '_id']}"
+            except AuthError:
+                pass
+    return f"ip:{request.remote_addr}"
+
+# Applies Config.RATE_LIMITS to each request before the view runs. A request
+# spends one token from every bucket its endpoint is limited by, and is
+# refused with 429 and Retry-After when any of them is empty. A refused
+# request spends nothing, so throttled clients don't drain shared buckets.
+def init_rate_limits(app):
+    @app.before_request
+    def check_rate_limits():
+        rules = app.config.get('RATE_LIMITS', {}).get(request.endpoint)
+        if not rules or not app.config.get('RATE_LIMIT_ENABLED', True) or request.method == 'OPTIONS':
+            return None
+
+        buckets = []
+        for scope, limit in rules:
+            rate, capacity = parse_limit(limit)
+            key = f"{request.endpoint}:{scope}:{limit}:{_rate_limit_identity(scope)}"
+            buckets.append((key, rate, capacity))
+        delay = get_rate_limiter().take_all(buckets)
+
+        if delay:
+            response, status_code = handle_error('Too many requests. Please try again later.', 429)
+            response.headers['Retry-After'] = str(math.ceil(delay))
+            return response, status_code
+        return None
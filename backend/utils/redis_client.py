@@ -0,0 +1,18 @@
+from flask import current_app
+
+_clients = {}
+
+# Shared Redis connection per URL. 'fakeredis://' gives an in-process fake
+# (requires the fakeredis package) so Redis-backed features run in tests.
+def get_redis(url=None):
+    url = url or current_app.config['REDIS_URL']
+    client = _clients.get(url)
+    if client is None:
+        if url.startswith('fakeredis://'):
+            import fakeredis
+            client = fakeredis.FakeRedis()
+        else:
+            import redis
+            client = redis.Redis.from_url(url)
+        _clients[url] = client
+    return client
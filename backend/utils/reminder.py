@@ -1,101 +1,231 @@
 from flask import current_app
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-import ssl
-import os
-from datetime import datetime, timedelta, timezone 
-from app.models import Order, OrderItem
-from celery import Celery
-
-celery = Celery(
-    'tasks',
-    broker='redis://localhost:6379/0',
-    backend='redis://localhost:6379/0',
-)
-
-def send_me_reminder_email(username, email, order_number, items):
-    template_path = os.path.join(os.path.dirname(__file__), '..', 'email', 'reminder.html')
-    with open(template_path, 'r') as file:
-        html_content = file.read()
-
-    # Generate the HTML for the items list
-    items_html = ""
-    for i, item in enumerate(items):
-        image_url = f"https://datawithimages.s3.ap-southeast-2.amazonaws.com/images/{item['product_id']}.jpg"
-        items_html += f'''
-            <div
-            style="width: 100%; background-color: #FFF; display: flex; flex-direction: row; justify-content: space-evenly; align-items: flex-start; padding: 10px; border-radius: 10px; box-sizing: border-box; margin-bottom: 10px">
-            <div style="width: 100%;  display: flex; flex-direction: row; align-items: center;">
-                <img src="{image_url}" alt="product"
-                    style="width: 90px; height: 70px; object-fit: cover; background-color: #e8e8e8; border-radius: 10px;" />
-                <div
-                    style="height: 70px; display: flex; flex-direction: column; align-items: flex-start; margin-left: 20px;">
-                    <h4
-                        style="margin: 0; font-size: 14px; color: #002020; word-wrap: break-word; overflow-wrap: break-word;">
-                        {item['product_name']}
-                    </h4>
-                </div>
-            </div>
-            <h4
-                style="width: 80px; height: 70px; margin: 0; font-size: 14px; color: #002020; text-align: right; word-wrap: break-word; overflow-wrap: break-word;">
-                ${item['price']:.2f}
-            </h4>
-        </div>
-        '''
-    
-    html_content = html_content.format(
-        order_number=order_number,
-        username=username,
-        items_html=items_html,
-    )
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import db, Order, OrderItem, Customers, Products, JobWatermark
+from utils.upsert import upsert
+from utils.templates import render_email
+from utils.outbox import create_bulk_body, queue_bulk_email, send_queued_emails
+from markupsafe import Markup
+from utils.tasks import celery, task, flask_app
+from celery import group, chord
+import logging
+
+logger = logging.getLogger('mediscan.reminder')
+
+REMINDER_WATERMARK = 'order_reminders'
+
+REMINDER_SUBJECT = 'Reminder: It\'s time to buy items again!'
+REMINDER_ITEMS_TAG = '-items-'
+
+# The reminder body shared by every digest in a run; each recipient's item
+# list is substituted for REMINDER_ITEMS_TAG by the email provider
+def create_reminder_body():
+    return create_bulk_body(render_email('reminder.html', items_html=Markup(REMINDER_ITEMS_TAG)))
+
+# Queues one customer's reminder digest; it is sent once the caller commits
+def queue_reminder_digest(bulk_body, email, items):
+    queue_bulk_email(email, REMINDER_SUBJECT, bulk_body, {
+        REMINDER_ITEMS_TAG: render_email('_reminder_items.html', items=items)
+    }, 'reminder')
 
-    # Escape curly braces in CSS and HTML
-    html_content = html_content.replace("{", "{{").replace("}", "}}")
+def get_watermark(name):
+    return db.session.execute(select(JobWatermark.value).where(JobWatermark.name == name)).scalar() or 0
 
-    message = Mail(
-        from_email=current_app.config['MAIL_FROM'],
-        to_emails=email,
-        subject='Reminder: It\'s time to buy items again!',
-        html_content=html_content
+def set_watermark(name, value):
+    now = datetime.now()
+    upsert(JobWatermark.__table__, {'name': name, 'value': value, 'updated_at': now},
+           {'value': value, 'updated_at': now}, ['name'])
+
+# Splits the orders due a reminder (placed REMINDER_DELAY_DAYS ago and not
+# reminded yet) after the watermark by customer, into customer id ranges
+# (lo, hi] of up to REMINDER_CHUNK_SIZE customers. Every due order of a
+# customer lands in the same chunk, so each customer gets one digest per run.
+# The run covers the orders with start < id <= high; orders placed while it
+# is running wait for the next one.
+def plan_reminder_run():
+    config = current_app.config
+    cutoff = datetime.now() - timedelta(days=config['REMINDER_DELAY_DAYS'])
+    start = get_watermark(REMINDER_WATERMARK)
+    due = (Order.id > start, Order.created_at <= cutoff, Order.reminder_sent_at.is_(None))
+    high = db.session.execute(select(func.max(Order.id)).where(*due)).scalar()
+    chunks = []
+    if high is None:
+        return cutoff, start, start, chunks
+
+    due = due + (Order.id <= high,)
+    lo = 0
+    while True:
+        hi = db.session.execute(
+            select(Order.customer_id).where(Order.customer_id > lo, *due)
+            .group_by(Order.customer_id).order_by(Order.customer_id)
+            .offset(config['REMINDER_CHUNK_SIZE'] - 1).limit(1)
+        ).scalar()
+        if hi is None:
+            hi = db.session.execute(select(func.max(Order.customer_id)).where(Order.customer_id > lo, *due)).scalar()
+            if hi is not None:
+                chunks.append((lo, hi))
+            break
+        chunks.append((lo, hi))
+        lo = hi
+
+    return cutoff, start, high, chunks
+
+# Queues reminders for the customers with lo < id <= hi, REMINDER_BATCH_SIZE
+# customers at a time. All of a batch's customers' due orders in the run
+# (start < order id <= high) are loaded with their items, and each customer
+# gets a single digest listing each product once; all digests share one
+# stored body and go out through the email outbox in bulk. Each batch commits
+# with its sent marks, so a retried chunk resumes where it failed, and rows
+# locked by another worker are skipped rather than reminded twice.
+#   progress    - optional callable receiving the running totals per batch
+def send_reminder_chunk(lo, hi, cutoff, start, high, progress=None):
+    config = current_app.config
+    due = (
+        Order.id > start,
+        Order.id <= high,
+        Order.created_at <= cutoff,
+        Order.reminder_sent_at.is_(None)
     )
+    bulk_body = None
+    summary = {'digests': 0, 'orders': 0}
+
+    while True:
+        customer_ids = db.session.execute(
+            select(Order.customer_id).where(Order.customer_id > lo, Order.customer_id <= hi, *due)
+            .group_by(Order.customer_id).order_by(Order.customer_id).limit(config['REMINDER_BATCH_SIZE'])
+        ).scalars().all()
+        if not customer_ids:
+            db.session.commit()
+            break
+
+        orders = Order.query.options(
+            joinedload(Order.customer).load_only(Customers.full_name, Customers.email),
+            selectinload(Order.items).joinedload(OrderItem.product).load_only(Products.product_id)
+        ).filter(
+            Order.customer_id.in_(customer_ids), *due
+        ).order_by(Order.id).with_for_update(skip_locked=True, of=Order).all()
 
-    try:
-        ssl._create_default_https_context = ssl._create_unverified_context
-        sg = SendGridAPIClient(os.getenv('SENDGRID_API_KEY'))
-        response = sg.send(message)
-        print(response.status_code)
-        print(response.body)
-        print(response.headers)
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        
-        
-@celery.task
+        # customer id -> (email, {product code: item}, [orders])
+        customer_digests = {}
+        now = datetime.now()
+        for order in orders:
+            # Nothing can be sent without an address; mark the order anyway so
+            # it doesn't hold the watermark back
+            if not order.customer.email:
+                order.reminder_sent_at = now
+            else:
+                email, items, digest_orders = customer_digests.setdefault(
+                    order.customer_id, (order.customer.email, {}, [])
+                )
+                for item in order.items:
+                    items.setdefault(item.product.product_id, {
+                        'product_id': item.product.product_id,
+                        'product_name': item.product_name,
+                        'price': item.price_at_purchase,
+                    })
+                digest_orders.append(order)
+        lo = customer_ids[-1]
+
+        if customer_digests and bulk_body is None:
+            bulk_body = create_reminder_body()
+
+        for email, items, digest_orders in customer_digests.values():
+            queue_reminder_digest(bulk_body, email, list(items.values()))
+            for order in digest_orders:
+                order.reminder_sent_at = now
+            summary['digests'] += 1
+            summary['orders'] += len(digest_orders)
+
+        db.session.commit()
+        if progress:
+            progress(summary)
+
+    return summary
+
+# Moves the watermark up to the end of a completed run, but never past an
+# order that is still waiting for its reminder: chunks skip orders locked by
+# another run, and if that run fails they must be picked up again
+def finish_reminder_run(high):
+    watermark = get_watermark(REMINDER_WATERMARK)
+    unsent = db.session.execute(
+        select(func.min(Order.id)).where(Order.id > watermark, Order.id <= high, Order.reminder_sent_at.is_(None))
+    ).scalar()
+    if unsent is not None:
+        high = unsent - 1
+    if high > watermark:
+        set_watermark(REMINDER_WATERMARK, high)
+    db.session.commit()
+
+# Runs every chunk in this process; the Celery task below fans them out
+def send_due_reminders():
+    cutoff, start, high, chunks = plan_reminder_run()
+    summary = {'digests': 0, 'orders': 0, 'chunks': len(chunks)}
+    for lo, hi in chunks:
+        chunk_summary = send_reminder_chunk(lo, hi, cutoff, start, high)
+        summary['digests'] += chunk_summary['digests']
+        summary['orders'] += chunk_summary['orders']
+    if chunks:
+        finish_reminder_run(high)
+
+    logger.info('Queued %(digests)d reminder digests for %(orders)d orders in %(chunks)d chunks', summary)
+    return summary
+
+# Plans a run and dispatches its chunks as a chord, so they spread across
+# Celery workers; the watermark only moves once every chunk has succeeded.
+# The header group is saved to the result backend, so the run's progress can
+# be followed with GroupResult.restore(group_id), and each chunk reports its
+# totals in a PROGRESS state while it runs. The in-process executor runs the
+# chunks one after another instead.
+@task('utils.reminder.send_reminder_email_task')
 def send_reminder_email_task():
-    # one_month_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    # Test *****************************************************
-    one_month_ago = datetime.now(timezone.utc) - timedelta(minutes=1) 
-    # **********************************************************
-    
-    orders = Order.query.filter(Order.created_at <= one_month_ago).all()
-
-    for order in orders:
-        # Retrieve order items to send in the reminder email
-        items = [
-            {
-                'product_id': item.product_id,
-                'product_name': item.product_name,
-                'price': item.price_at_purchase,
-            }
-            for item in order.items
-        ]
-
-        # Send reminder email
-        send_me_reminder_email(
-            username=order.customer.full_name,
-            email=order.customer.email,
-            order_number=order.order_number,
-            items=items
-        )
-
-    return "Reminder emails sent."
\ No newline at end of file
+    if current_app.config['TASK_BACKEND'] != 'celery':
+        return send_due_reminders()
+
+    cutoff, start, high, chunks = plan_reminder_run()
+    if not chunks:
+        return {'chunks': 0}
+
+    header = group(send_reminder_chunk_task.s(lo, hi, cutoff.isoformat(), start, high) for lo, hi in chunks)
+    result = chord(header)(finish_reminder_run_task.s(high))
+    run = {'chunks': len(chunks), 'high': high, 'result_id': result.id}
+    # No header result is kept when tasks run eagerly
+    if result.parent is not None:
+        result.parent.save()
+        run['group_id'] = result.parent.id
+    logger.info('Dispatched reminder run of %d chunks up to order %d', len(chunks), high)
+    return run
+
+# One customer id range of a reminder run, retried with exponential backoff. Sending
+# starts as soon as the chunk is queued; outbox drains on several workers
+# share the global EMAIL_SEND_RATE.
+@celery.task(bind=True, name='utils.reminder.send_reminder_chunk_task')
+def send_reminder_chunk_task(self, lo, hi, cutoff, start, high):
+    app = flask_app()
+    with app.app_context():
+        try:
+            summary = send_reminder_chunk(lo, hi, datetime.fromisoformat(cutoff), start, high, lambda totals: self.update_state(
+                state='PROGRESS', meta=dict(totals, lo=lo, hi=hi)
+            ))
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('Reminder chunk (%d, %d] failed: %s', lo, hi, e)
+            raise self.retry(
+                exc=e,
+                countdown=app.config['REMINDER_CHUNK_RETRY_SECONDS'] * 2 ** self.request.retries,
+                max_retries=app.config['REMINDER_CHUNK_MAX_RETRIES']
+            )
+        send_queued_emails()
+    return summary
+
+@celery.task(name='utils.reminder.finish_reminder_run_task')
+def finish_reminder_run_task(summaries, high):
+    with flask_app().app_context():
+        finish_reminder_run(high)
+    summary = {
+        'digests': sum(chunk['digests'] for chunk in summaries),
+        'orders': sum(chunk['orders'] for chunk in summaries),
+        'chunks': len(summaries),
+    }
+    logger.info('Queued %(digests)d reminder digests for %(orders)d orders in %(chunks)d chunks', summary)
+    return summary
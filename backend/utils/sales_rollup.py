@@ -0,0 +1,127 @@
+from sqlalchemy import select, insert, delete, func
+from app.models import db, Order, OrderItem, DailySales, ProductDailySales, CustomerOrderStats
+from utils.upsert import upsert
+from datetime import datetime
+import logging
+
+logger = logging.getLogger('mediscan.sales_rollup')
+
+# Adds one order to the rollups. Runs inside the order's transaction, so the
+# rollups commit (or roll back) together with the order. Costs three upserts
+# regardless of the number of lines.
+#   order       - the flushed Order
+#   lines       - the order item rows (product_id, quantity, price_at_purchase)
+def record_order_sales(order, lines):
+    now = datetime.now()
+    day = order.created_at.date()
+    units = sum(line['quantity'] for line in lines)
+
+    daily = DailySales.__table__
+    upsert(daily, {
+        'day': day,
+        'order_count': 1,
+        'units': units,
+        'revenue': order.total_price,
+        'updated_at': now,
+    }, {
+        'order_count': daily.c.order_count + 1,
+        'units': daily.c.units + units,
+        'revenue': daily.c.revenue + order.total_price,
+        'updated_at': now,
+    }, ['day'])
+
+    # Rows are upserted in key order, so concurrent orders sharing products
+    # lock them in the same order and cannot deadlock
+    product_daily = ProductDailySales.__table__
+    upsert(product_daily, [
+        {
+            'day': day,
+            'product_id': line['product_id'],
+            'units': line['quantity'],
+            'revenue': line['price_at_purchase'] * line['quantity'],
+            'updated_at': now,
+        }
+        for line in sorted(lines, key=lambda line: line['product_id'])
+    ], lambda incoming: {
+        'units': product_daily.c.units + incoming.units,
+        'revenue': product_daily.c.revenue + incoming.revenue,
+        'updated_at': now,
+    }, ['day', 'product_id'])
+
+    stats = CustomerOrderStats.__table__
+    upsert(stats, {
+        'customer_id': order.customer_id,
+        'order_count': 1,
+        'units': units,
+        'total_spent': order.total_price,
+        'first_order_at': order.created_at,
+        'last_order_at': order.created_at,
+    }, {
+        'order_count': stats.c.order_count + 1,
+        'units': stats.c.units + units,
+        'total_spent': stats.c.total_spent + order.total_price,
+        'last_order_at': order.created_at,
+    }, ['customer_id'])
+
+# Recomputes every rollup from orders and order_items in one transaction.
+# Only needed to backfill existing history or to repair drift.
+def rebuild_sales_rollups():
+    now = datetime.now()
+    day = func.date(Order.created_at)
+    try:
+        db.session.execute(delete(DailySales))
+        db.session.execute(delete(ProductDailySales))
+        db.session.execute(delete(CustomerOrderStats))
+
+        units_per_order = (
+            select(OrderItem.order_id, func.sum(OrderItem.quantity).label('units'))
+            .group_by(OrderItem.order_id)
+            .subquery()
+        )
+
+        db.session.execute(insert(DailySales).from_select(
+            ['day', 'order_count', 'units', 'revenue', 'updated_at'],
+            select(
+                day,
+                func.count(Order.id),
+                func.coalesce(func.sum(units_per_order.c.units), 0),
+                func.sum(Order.total_price),
+                func.now()
+            )
+            .outerjoin(units_per_order, units_per_order.c.order_id == Order.id)
+            .group_by(day)
+        ))
+
+        db.session.execute(insert(ProductDailySales).from_select(
+            ['day', 'product_id', 'units', 'revenue', 'updated_at'],
+            select(
+                day,
+                OrderItem.product_id,
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.quantity * OrderItem.price_at_purchase),
+                func.now()
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .group_by(day, OrderItem.product_id)
+        ))
+
+        db.session.execute(insert(CustomerOrderStats).from_select(
+            ['customer_id', 'order_count', 'units', 'total_spent', 'first_order_at', 'last_order_at'],
+            select(
+                Order.customer_id,
+                func.count(Order.id),
+                func.coalesce(func.sum(units_per_order.c.units), 0),
+                func.sum(Order.total_price),
+                func.min(Order.created_at),
+                func.max(Order.created_at)
+            )
+            .outerjoin(units_per_order, units_per_order.c.order_id == Order.id)
+            .group_by(Order.customer_id)
+        ))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info('Rebuilt sales rollups in %.1f s', (datetime.now() - now).total_seconds())
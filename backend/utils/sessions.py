@@ -0,0 +1,66 @@
+from flask import current_app
+from flask_session import Session
+from sqlalchemy import select, delete
+from app.models import db
+from utils.redis_client import get_redis
+from datetime import datetime
+import logging
+
+logger = logging.getLogger('mediscan.sessions')
+
+# Session storage, selected with Config.SESSION_BACKEND:
+#   'cookie'     - Flask's signed cookie; nothing stored server-side (default,
+#                  sessions only hold small values such as the cart id)
+#   'memory'     - Flask-Session with a per-process cachelib SimpleCache
+#   'redis'      - Flask-Session in Redis at REDIS_URL
+#   'sqlalchemy' - Flask-Session in the SESSION_SQLALCHEMY_TABLE table;
+#                  expired rows are removed by purge_expired_sessions
+# Server-side sessions are only written when they change
+# (SESSION_REFRESH_EACH_REQUEST is off).
+def init_sessions(app):
+    config = app.config
+    backend = config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'cookie':
+        return
+    if backend == 'memory':
+        from cachelib import SimpleCache
+        config['SESSION_TYPE'] = 'cachelib'
+        config['SESSION_CACHELIB'] = SimpleCache(threshold=config['SESSION_MEMORY_MAX_ENTRIES'])
+    elif backend == 'redis':
+        config['SESSION_TYPE'] = 'redis'
+        config['SESSION_REDIS'] = get_redis(config['REDIS_URL'])
+    elif backend == 'sqlalchemy':
+        config['SESSION_TYPE'] = 'sqlalchemy'
+        config['SESSION_SQLALCHEMY'] = db
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+    Session(app)
+
+# Deletes expired rows from the SQL session table in batches
+def purge_expired_sessions(batch_size=500):
+    session_model = getattr(current_app.session_interface, 'sql_session_model', None)
+    if session_model is None:
+        return 0
+
+    # Flask-Session stores expiry in UTC
+    now = datetime.utcnow()
+    purged = 0
+    while True:
+        ids = db.session.execute(
+            select(session_model.id).where(session_model.expiry <= now).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        try:
+            result = db.session.execute(
+                delete(session_model).where(session_model.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        purged += result.rowcount
+
+    logger.info('Purged %d expired sessions', purged)
+    return purged
@@ -0,0 +1,284 @@
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from celery import Celery
+from celery.schedules import schedule as interval_schedule
+from app.config import Config
+from app.models import db, BackgroundTask, TaskSchedule
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import functools
+import threading
+import logging
+import json
+import os
+
+logger = logging.getLogger('mediscan.tasks')
+
+# Background tasks, run by the executor selected with Config.TASK_BACKEND:
+#   'celery' - published to CELERY_BROKER_URL and run by Celery workers, with
+#              periodic tasks from celery beat
+#   'thread' - stored in the background_tasks table and run by a bounded
+#              thread pool in each web process, which also queue the periodic
+#              tasks in place of celery beat (do not run beat as well); for
+#              small deployments and tests
+# Tasks are plain functions registered with @task and started with .delay();
+# they always run inside a Flask app context.
+
+celery = Celery('mediscan', broker=Config.CELERY_BROKER_URL, backend=Config.CELERY_RESULT_BACKEND)
+celery.conf.update(
+    timezone='UTC',
+    enable_utc=True,
+)
+
+_flask_app = None
+
+# Database work needs a Flask app context inside the Celery worker
+def flask_app():
+    global _flask_app
+    if _flask_app is None:
+        from app.app import create_app
+        _flask_app = create_app()
+    return _flask_app
+
+_registry = {}
+
+class Task:
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    # Runs the task in the background; returns the executor's task id
+    def delay(self, *args, **kwargs):
+        return enqueue(self.name, *args, **kwargs)
+
+# Registers a background task under `name` with both executors.
+# celery_options are passed to Celery's task decorator.
+def task(name, **celery_options):
+    def decorator(func):
+        @celery.task(name=name, **celery_options)
+        @functools.wraps(func)
+        def celery_task(*args, **kwargs):
+            with flask_app().app_context():
+                return func(*args, **kwargs)
+
+        registered = _registry[name] = Task(name, func)
+        return registered
+    return decorator
+
+def enqueue(name, *args, **kwargs):
+    return get_task_executor().submit(name, args, kwargs)
+
+class CeleryTaskExecutor:
+    def submit(self, name, args, kwargs):
+        return celery.send_task(name, args=args, kwargs=kwargs).id
+
+    def start(self):
+        pass
+
+# Runs queued tasks on up to `workers` threads. A dispatcher thread claims
+# due rows from background_tasks with a lease, like the email outbox, so
+# tasks survive restarts: a task that was running when the process died is
+# picked up again once its lease expires. Failed tasks are retried with
+# exponential backoff up to TASK_MAX_ATTEMPTS.
+class ThreadTaskExecutor:
+    def __init__(self, app, workers, poll_seconds, lease_seconds, max_attempts, retry_seconds):
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._pool = None
+        self._pid = None
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._schedule = {}
+
+    # The queue row is committed in its own transaction, so the task is
+    # queued even if the caller's transaction later rolls back. Tasks queued
+    # outside a web process (CLI commands, scripts) wait for one to run them.
+    def submit(self, name, args, kwargs):
+        if name not in _registry:
+            raise ValueError(f"Unknown task: {name}")
+        with Session(db.engine) as session:
+            background_task = self._new_task(name, args, kwargs)
+            session.add(background_task)
+            session.commit()
+            task_id = background_task.id
+        self._wake.set()
+        return task_id
+
+    def _new_task(self, name, args, kwargs):
+        return BackgroundTask(
+            name=name,
+            arguments=json.dumps({'args': list(args), 'kwargs': kwargs}),
+            status='pending',
+            run_at=datetime.now()
+        )
+
+    # Starts the dispatcher and pool, once per process (a forked server
+    # worker starts its own). Called before each request, so only web
+    # processes run tasks, not CLI commands or Celery workers that create
+    # the app.
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._busy = 0
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='task')
+            self._schedule = self._load_schedule()
+            threading.Thread(target=self._dispatch, name='task-dispatcher', daemon=True).start()
+
+    # The celery beat schedule, run from the web processes instead of beat
+    def _load_schedule(self):
+        entries = {}
+        for entry in celery.conf.beat_schedule.values():
+            run_every = entry['schedule']
+            if isinstance(run_every, (int, float)):
+                run_every = interval_schedule(timedelta(seconds=run_every))
+            entries[entry['task']] = run_every
+        return entries
+
+    def _dispatch(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self._enqueue_due_periodic_tasks()
+                    for background_task in self._claim():
+                        self._pool.submit(self._execute, background_task)
+            except Exception as e:
+                logger.exception('Task dispatcher failed: %s', e)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    # Every process checks the schedule, but a run is only queued by the one
+    # whose conditional update of the task's task_schedules row succeeds, in
+    # the same transaction as the queue row
+    def _enqueue_due_periodic_tasks(self):
+        last_runs = dict(db.session.execute(select(TaskSchedule.name, TaskSchedule.last_run_at)).all())
+        db.session.commit()
+        for name, run_every in self._schedule.items():
+            if name not in last_runs:
+                last_runs[name] = self._add_schedule_row(name, run_every)
+            last_run_at = last_runs[name]
+            if not run_every.is_due(last_run_at.replace(tzinfo=timezone.utc)).is_due:
+                continue
+            try:
+                result = db.session.execute(
+                    update(TaskSchedule)
+                    .where(TaskSchedule.name == name, TaskSchedule.last_run_at == last_run_at)
+                    .values(last_run_at=run_every.now().astimezone(timezone.utc).replace(tzinfo=None))
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    db.session.add(self._new_task(name, (), {}))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    # Starts a new periodic task's schedule from now; returns its last run
+    def _add_schedule_row(self, name, run_every):
+        now = run_every.now().astimezone(timezone.utc).replace(tzinfo=None)
+        try:
+            db.session.add(TaskSchedule(name=name, last_run_at=now))
+            db.session.commit()
+            return now
+        except IntegrityError:
+            db.session.rollback()
+            return db.session.execute(select(TaskSchedule.last_run_at).where(TaskSchedule.name == name)).scalar_one()
+
+    # Claims as many due tasks as there are idle threads
+    def _claim(self):
+        with self._lock:
+            limit = self.workers - self._busy
+        if limit <= 0:
+            return []
+
+        now = datetime.now()
+        try:
+            claimed = db.session.execute(
+                select(BackgroundTask.id, BackgroundTask.name, BackgroundTask.arguments, BackgroundTask.attempts)
+                .where(BackgroundTask.status == 'pending', BackgroundTask.run_at <= now)
+                .order_by(BackgroundTask.run_at, BackgroundTask.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if claimed:
+                db.session.execute(
+                    update(BackgroundTask)
+                    .where(BackgroundTask.id.in_([row.id for row in claimed]))
+                    .values(run_at=now + timedelta(seconds=self.lease_seconds), attempts=BackgroundTask.attempts + 1)
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        with self._lock:
+            self._busy += len(claimed)
+        return claimed
+
+    def _execute(self, claimed):
+        attempts = claimed.attempts + 1
+        with self.app.app_context():
+            try:
+                arguments = json.loads(claimed.arguments)
+                _registry[claimed.name].func(*arguments['args'], **arguments['kwargs'])
+                values = {'status': 'done', 'finished_at': datetime.now(), 'last_error': None}
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Task %s (%d) failed: %s', claimed.name, claimed.id, e)
+                if attempts >= self.max_attempts:
+                    values = {'status': 'failed', 'finished_at': datetime.now(), 'last_error': str(e)}
+                else:
+                    delay = self.retry_seconds * 2 ** (attempts - 1)
+                    values = {'run_at': datetime.now() + timedelta(seconds=delay), 'last_error': str(e)}
+            try:
+                db.session.execute(update(BackgroundTask).where(BackgroundTask.id == claimed.id).values(**values))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Could not record the result of task %d: %s', claimed.id, e)
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self._busy -= 1
+        self._wake.set()
+
+def create_task_executor(app):
+    import utils.celery  # Registers the tasks and their schedule
+    config = app.config
+    backend = config.get('TASK_BACKEND', 'celery')
+    if backend == 'celery':
+        return CeleryTaskExecutor()
+    if backend == 'thread':
+        return ThreadTaskExecutor(
+            app,
+            workers=config['TASK_WORKERS'],
+            poll_seconds=config['TASK_POLL_SECONDS'],
+            lease_seconds=config['TASK_LEASE_SECONDS'],
+            max_attempts=config['TASK_MAX_ATTEMPTS'],
+            retry_seconds=config['TASK_RETRY_SECONDS']
+        )
+    raise ValueError(f"Unknown task backend: {backend}")
+
+# Starts the executor in processes that serve requests
+def init_task_executor(app):
+    @app.before_request
+    def start_task_executor():
+        app.extensions['task_executor'].start()
+
+def get_task_executor():
+    return current_app.extensions['task_executor']
@@ -0,0 +1,23 @@
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+import os
+
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), '..', 'email')
+
+# Email templates are compiled once per process and kept in memory; values
+# are HTML-escaped unless a template marks them safe
+email_templates = Environment(
+    loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+    cache_size=-1,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+# Compiles every email template up front so the first send does not pay for it
+def load_email_templates():
+    for name in email_templates.list_templates(extensions=['html']):
+        email_templates.get_template(name)
+
+def render_email(template_name, **context):
+    return email_templates.get_template(template_name).render(**context)
@@ -0,0 +1,123 @@
+from flask import current_app
+from utils.redis_client import get_redis
+import threading
+import hashlib
+import math
+import time
+
+# Revoked JWT ids (jti), each kept until the token it belongs to expires.
+# Selected with Config.TOKEN_REVOCATION_STORE:
+#   'memory' - revocations live in this process (single worker and tests)
+#   'redis'  - revocations are shared by every worker; each worker checks a
+#              local Bloom filter first, so tokens that were never revoked
+#              (nearly all of them) are accepted without a Redis round trip
+
+class RevocationStore:
+    # expires_at is the token's exp claim, in epoch seconds
+    def revoke(self, jti, expires_at):
+        raise NotImplementedError
+
+    def is_revoked(self, jti):
+        raise NotImplementedError
+
+class MemoryRevocationStore(RevocationStore):
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            now = time.time()
+            for expired in [key for key, expiry in self._revoked.items() if expiry <= now]:
+                del self._revoked[expired]
+
+    def is_revoked(self, jti):
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+# Fixed-size Bloom filter: no false negatives, and false positives at about
+# error_rate once `capacity` items have been added
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+# Each revocation is a key with the token's remaining life as its TTL, which
+# is authoritative, plus an entry in a sorted set scored by expiry. Workers
+# rebuild their Bloom filter from the sorted set at most every
+# sync_seconds, so a logout handled by another worker is honoured within
+# that interval; logouts handled by this worker are honoured immediately.
+class RedisRevocationStore(RevocationStore):
+    def __init__(self, client, sync_seconds, capacity, error_rate, prefix='revoked_jwt:'):
+        self.client = client
+        self.sync_seconds = sync_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.prefix = prefix
+        self.index_key = prefix + 'index'
+        self._bloom = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        now = time.time()
+        ttl = math.ceil(expires_at - now)
+        if ttl <= 0:
+            return
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + jti, 1, ex=ttl)
+        pipe.zadd(self.index_key, {jti: expires_at})
+        pipe.zremrangebyscore(self.index_key, '-inf', now)
+        pipe.execute()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def _sync(self):
+        now = time.time()
+        with self._lock:
+            if self._bloom is not None and now - self._synced_at < self.sync_seconds:
+                return self._bloom
+            revoked = self.client.zrangebyscore(self.index_key, now, '+inf')
+            bloom = BloomFilter(max(self.capacity, len(revoked) * 2), self.error_rate)
+            for jti in revoked:
+                bloom.add(jti.decode('utf-8'))
+            self._bloom = bloom
+            self._synced_at = now
+            return bloom
+
+    def is_revoked(self, jti):
+        if jti not in self._sync():
+            return False
+        return bool(self.client.exists(self.prefix + jti))
+
+def create_revocation_store(config):
+    backend = config.get('TOKEN_REVOCATION_STORE', 'memory')
+    if backend == 'memory':
+        return MemoryRevocationStore()
+    if backend == 'redis':
+        return RedisRevocationStore(
+            get_redis(config['REDIS_URL']),
+            sync_seconds=config['TOKEN_REVOCATION_SYNC_SECONDS'],
+            capacity=config['TOKEN_REVOCATION_BLOOM_CAPACITY'],
+            error_rate=config['TOKEN_REVOCATION_BLOOM_ERROR_RATE']
+        )
+    raise ValueError(f"Unknown token revocation store: {backend}")
+
+def get_revocation_store():
+    return current_app.extensions['token_revocations']
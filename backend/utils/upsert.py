@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
+from app.models import db
+
+# Single-statement INSERT ... ON DUPLICATE KEY UPDATE (MySQL) or
+# INSERT ... ON CONFLICT DO UPDATE (SQLite/PostgreSQL). Other dialects fall
+# back to an insert inside a savepoint followed by an update on conflict.
+#   values      - column values for the new row, including the unique keys,
+#                 or a list of such rows to upsert in one statement
+#   set_        - column values/expressions applied when the row exists, or a
+#                 callable taking the proposed row (e.g. incoming.units) and
+#                 returning them, for per-row updates of multi-row upserts
+#   keys        - names of the columns forming the unique constraint
+def upsert(table, values, set_, keys, session=None):
+    session = session or db.session
+    dialect = session.get_bind().dialect.name
+    rows = values if isinstance(values, list) else [values]
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(**(set_(stmt.inserted) if callable(set_) else set_))
+        return session.execute(stmt)
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert_factory = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert_factory(table).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_=set_(stmt.excluded) if callable(set_) else set_)
+        return session.execute(stmt)
+
+    result = None
+    for row in rows:
+        try:
+            with session.begin_nested():
+                result = session.execute(insert(table).values(**row))
+        except IntegrityError:
+            row_set = set_(SimpleNamespace(**row)) if callable(set_) else set_
+            stmt = update(table).where(*[table.c[key] == row[key] for key in keys]).values(**row_set)
+            result = session.execute(stmt)
+    return result
@@ -1,6 +1,5 @@
-from flask import request, current_app
+from flask import request
 from app.models import Customers, Employees
-import jwt
 import re
 
 def is_valid_email(email):
@@ -28,19 +27,20 @@ def get_employee_by_id(employee_id):
     return Employees.query.filter_by(employee_id=employee_id).first()
 
 def get_current_customer():
+    from utils.auth import get_claims, AuthError
     auth_header = request.headers.get('Authorization')
     if auth_header:
-        token = auth_header.split(" ")[1]
         try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            return data.get('customer_id')
-        except jwt.ExpiredSignatureError:
-            return None  # Token has expired
-        except jwt.InvalidTokenError:
-            return None  # Invalid token
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            return None
+            return get_claims('customer')['customer_id']
+        except AuthError:
+            return None  # Missing, invalid, expired or revoked token
     else:
         temp_user_id = request.headers.get('Temporary-UserId')
         return temp_user_id if temp_user_id else None
+
+def get_current_employee():
+    from utils.auth import get_claims, AuthError
+    try:
+        return get_claims('employee')['employee_id']
+    except AuthError:
+        return None  # Missing, invalid, expired or revoked token
@@ -2,16 +2,16 @@ import React, { FC, useState, useEffect } from 'react';
 import { StyleSheet, Text, View, TouchableOpacity, SafeAreaView } from 'react-native';
 import { useFilter } from '@/context/FilterContext';
 import { FlatList } from 'react-native-gesture-handler';
-import { useQuery } from '@tanstack/react-query';
+import { useInfiniteQuery } from '@tanstack/react-query';
 import { useNavigation } from '@react-navigation/native';
 import { Image } from 'expo-image';
 import { Colors } from '../../constants/colors';
-import { fetchOrders } from '@/hooks/useOrderDataFetch';
+import { fetchOrderPage, fetchOrderDetail } from '@/hooks/useOrderDataFetch';
 import { NavigationProps } from '@/utils/navi-props'
 import CloseIcon from '@/assets/images/close.png';
 import ArrowRightIcon from '@/assets/images/arrow-right.png';
 import Loading from '@/components/loading/Loading';
-import { Order } from '@/utils/index';
+import { Order, OrderSummary } from '@/utils/index';
 import OrderDetailScreen from './OrderDetailScreen';
 import SearchBar from '@/components/filters/SearchBar';
 
@@ -19,27 +19,32 @@ const OrderHistoryScreen: FC = () => {
     const navigation = useNavigation<NavigationProps>();
     const [selectedOrder, setSelectedOrder] = useState<Order | null>(null);
     const [searchQuery, setSearchQuery] = useState('');
-    const [filteredOrders, setFilteredOrders] = useState<Order[]>([]);
+    const [filteredOrders, setFilteredOrders] = useState<OrderSummary[]>([]);
 
-    const { data: OrderData, isLoading } = useQuery({
+    // Orders are loaded a page at a time, the next page when the list is
+    // scrolled to the end
+    const { data: OrderPages, isLoading, hasNextPage, isFetchingNextPage, fetchNextPage } = useInfiniteQuery({
         queryKey: ['OrderData'],
-        queryFn: fetchOrders,
+        queryFn: ({ pageParam }) => fetchOrderPage(pageParam),
+        initialPageParam: null as number | null,
+        getNextPageParam: (lastPage) => lastPage.nextCursor,
         retry: false,
         refetchOnWindowFocus: true,
     });
+    const OrderData = OrderPages?.pages.flatMap((page) => page.orders);
 
     useEffect(() => {
         if (OrderData) {
-            const sortedOrders = OrderData.sort((a: Order, b: Order) => {
+            const sortedOrders = OrderData.sort((a: OrderSummary, b: OrderSummary) => {
                 return new Date(b.createdAt).getTime() - new Date(a.createdAt).getTime();
             });
 
             const filtered = filterAndSortOrders(sortedOrders);
             setFilteredOrders(filtered);
         }
-    }, [searchQuery, OrderData]);
+    }, [searchQuery, OrderPages]);
 
-    const filterAndSortOrders = (orders: Order[]): Order[] => {
+    const filterAndSortOrders = (orders: OrderSummary[]): OrderSummary[] => {
         if (!orders) return [];
 
         let updatedOrders = orders;
@@ -68,10 +73,10 @@ const OrderHistoryScreen: FC = () => {
         return updatedOrders;
     };
 
-    const groupOrdersByMonthYear = (orders: Order[]): Record<string, Order[]> => {
-        const groupedOrders: Record<string, Order[]> = {};
+    const groupOrdersByMonthYear = (orders: OrderSummary[]): Record<string, OrderSummary[]> => {
+        const groupedOrders: Record<string, OrderSummary[]> = {};
 
-        orders.forEach((order: Order) => {
+        orders.forEach((order: OrderSummary) => {
             const orderDate = new Date(order.createdAt);
             const monthYear = `${orderDate.toLocaleString('default', { month: 'long' })}, ${orderDate.getFullYear()}`;
 
@@ -85,8 +90,17 @@ const OrderHistoryScreen: FC = () => {
         return groupedOrders;
     };
 
-    const showOrderDetail = (order: Order) => {
-        setSelectedOrder(order);
+    const showOrderDetail = async (order: OrderSummary) => {
+        const orderDetail = await fetchOrderDetail(order.orderNumber);
+        if (orderDetail) {
+            setSelectedOrder(orderDetail);
+        }
+    };
+
+    const loadMoreOrders = () => {
+        if (hasNextPage && !isFetchingNextPage) {
+            fetchNextPage();
+        }
     };
 
     const detailScreenClose = () => {
@@ -124,6 +138,9 @@ const OrderHistoryScreen: FC = () => {
                     contentContainerStyle={styles.listWrapper}
                     showsVerticalScrollIndicator={false}
                     horizontal={false}
+                    onEndReached={loadMoreOrders}
+                    onEndReachedThreshold={0.5}
+                    ListFooterComponent={isFetchingNextPage ? <Loading /> : null}
                     renderItem={({ item: monthYear }) => (
                         <>
                             <Text style={styles.dateText}>{monthYear}</Text>
@@ -141,9 +158,9 @@ const OrderHistoryScreen: FC = () => {
                                             <View style={styles.orderNumberItemCover}>
                                                 <Text style={styles.listOrderNumber}>#{order.orderNumber}</Text>
                                                 <View style={styles.listImageContainer}>
-                                                    {order.items.map((item, index) => (
+                                                    {order.productIds.map((productId, index) => (
                                                         <View key={index} style={styles.orderImageCover}>
-                                                            <Image source={`https://datawithimages.s3.ap-southeast-2.amazonaws.com/images/${item.productId}.jpg`} alt={item.productName} contentFit='contain' style={styles.orderImage} />
+                                                            <Image source={`https://datawithimages.s3.ap-southeast-2.amazonaws.com/images/${productId}.jpg`} alt={productId} contentFit='contain' style={styles.orderImage} />
                                                         </View>
                                                     ))}
                                                 </View>
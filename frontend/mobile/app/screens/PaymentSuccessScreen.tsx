@@ -121,6 +121,10 @@ const PaymentSuccessScreen: FC<Props> = ({ isPaymentSuccessScreen }) => {
                     shippingFee,
                     totalPrice,
                     imageUrls
+                }, {
+                    headers: {
+                        'Idempotency-Key': orderNumber
+                    }
                 });
                 console.log('Email sent successfully:');
                 setEmailSent(true);
@@ -158,7 +162,8 @@ const PaymentSuccessScreen: FC<Props> = ({ isPaymentSuccessScreen }) => {
                 const token = await AsyncStorage.getItem('authToken');
                 const res = await axiosClient.post('/orders/create', data, {
                     headers: {
-                        'Authorization': `Bearer ${token}`
+                        'Authorization': `Bearer ${token}`,
+                        'Idempotency-Key': data.orderNumber
                     },
                     withCredentials: true,
                 });
@@ -1,19 +1,37 @@
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import axiosClient from '@/app/api/axiosClient';
-import { Order } from '@/utils';
+import { Order, OrderPage } from '@/utils';
 
-export const fetchOrders = async (): Promise<Order[]> => {
+// One page of the order history; pass the previous page's nextCursor to get
+// the page after it
+export const fetchOrderPage = async (cursor: number | null): Promise<OrderPage> => {
     try {
-        const response = await axiosClient.get(`/orders`);
+        const response = await axiosClient.get(`/orders`, { params: cursor ? { cursor } : {} });
 
         if (!response.data) {
             console.error('Error fetching order histories');
-            return [];
+            return { orders: [], nextCursor: null };
         }
 
-        return response.data.orders;
+        return response.data;
     } catch (error) {
         console.error('Failed to fetch order histories:', error);
         throw error;
     }
 };
+
+export const fetchOrderDetail = async (orderNumber: string): Promise<Order | null> => {
+    try {
+        const response = await axiosClient.get(`/orders/${orderNumber}`);
+
+        if (!response.data) {
+            console.error('Error fetching order detail');
+            return null;
+        }
+
+        return response.data.order;
+    } catch (error) {
+        console.error('Failed to fetch order detail:', error);
+        throw error;
+    }
+};
@@ -48,6 +48,21 @@ export type Order = {
     items: OrderItem[];
 }
 
+export type OrderSummary = {
+    id: number;
+    orderNumber: string;
+    totalPrice: number;
+    createdAt: string;
+    itemCount: number;
+    totalQuantity: number;
+    productIds: string[];
+}
+
+export type OrderPage = {
+    orders: OrderSummary[];
+    nextCursor: number | null;
+}
+
 export type OrderItem = {
     id: number;
     orderId: number;